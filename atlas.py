@@ -0,0 +1,149 @@
+import os, json
+from PIL import Image
+from layer_cache import get_layer_cache
+
+# Атлас хранится в подпапке рядом с model.json, чтобы листы атласа
+# не попадали в список импортированных изображений редактора
+ATLAS_DIR = ".atlas"
+ATLAS_FILE = "atlas.json"
+ATLAS_FORMAT = 1
+SHEET_SIZE = 2048
+RESAMPLE = "LANCZOS"
+
+def _layer_key(layer):
+    """Ключ слоя в атласе: файл и параметры трансформации"""
+    return "|".join(str(v) for v in (
+        layer.get("file"),
+        float(layer.get("scale", 1.0)),
+        int(layer.get("rotation", 0)),
+        bool(layer.get("is_gif", False)),
+    ))
+
+def _source_info(fp):
+    """Отпечаток исходного файла для проверки актуальности атласа"""
+    st = os.stat(fp)
+    return {'mtime': st.st_mtime_ns, 'size': st.st_size, 'resample': RESAMPLE}
+
+def _model_sources(model_json, model_dir):
+    """Слои модели с существующими файлами: ключ -> (слой, путь)"""
+    sources = {}
+    for layer in model_json.get("layers", []):
+        filename = layer.get("file")
+        if not filename:
+            continue
+        fp = os.path.join(model_dir, filename)
+        if os.path.exists(fp):
+            sources.setdefault(_layer_key(layer), (layer, fp))
+    return sources
+
+def _pack(sizes, sheet_size=SHEET_SIZE):
+    """Упаковка прямоугольников по полкам: [(лист, x, y)] в порядке sizes"""
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i][1])
+    positions = [None] * len(sizes)
+    sheet, x, y, shelf_h = 0, 0, 0, 0
+    sheet_dims = [[0, 0]]
+    for i in order:
+        w, h = sizes[i]
+        width = max(sheet_size, w)
+        if x + w > width:
+            x, y, shelf_h = 0, y + shelf_h, 0
+        if y + h > max(sheet_size, h) and (x or y):
+            sheet, x, y, shelf_h = sheet + 1, 0, 0, 0
+            sheet_dims.append([0, 0])
+        positions[i] = (sheet, x, y)
+        sheet_dims[sheet][0] = max(sheet_dims[sheet][0], x + w)
+        sheet_dims[sheet][1] = max(sheet_dims[sheet][1], y + h)
+        x += w
+        shelf_h = max(shelf_h, h)
+    return positions, sheet_dims
+
+def build_atlas(model_json, model_dir):
+    """Сборка атласа модели и сохранение его рядом с model.json.
+
+    Возвращает словарь ключ слоя -> (кадры, длительности).
+    """
+    layers = {}
+    entries = {}
+    all_frames = []
+    for key, (layer, fp) in _model_sources(model_json, model_dir).items():
+        try:
+            frames, durations = get_layer_cache().load(
+                fp,
+                float(layer.get("scale", 1.0)),
+                int(layer.get("rotation", 0)),
+                bool(layer.get("is_gif", False)),
+                RESAMPLE,
+            )
+        except Exception as e:
+            print(f"Ошибка загрузки изображения: {e}")
+            continue
+        layers[key] = (frames, durations)
+        entries[key] = {'source': _source_info(fp), 'durations': durations,
+                        'frames': [len(all_frames) + i for i in range(len(frames))]}
+        all_frames.extend(frames)
+
+    try:
+        positions, sheet_dims = _pack([f.size for f in all_frames])
+        sheets = [Image.new("RGBA", (max(1, w), max(1, h)), (0, 0, 0, 0)) for w, h in sheet_dims]
+        rects = []
+        for frame, (sheet, x, y) in zip(all_frames, positions):
+            sheets[sheet].paste(frame, (x, y))
+            rects.append([sheet, x, y, frame.width, frame.height])
+        for entry in entries.values():
+            entry['frames'] = [rects[i] for i in entry['frames']]
+
+        atlas_dir = os.path.join(model_dir, ATLAS_DIR)
+        os.makedirs(atlas_dir, exist_ok=True)
+        sheet_files = []
+        for i, sheet in enumerate(sheets):
+            name = f"sheet{i}.png"
+            sheet.save(os.path.join(atlas_dir, name), compress_level=1)
+            sheet_files.append(name)
+        with open(os.path.join(atlas_dir, ATLAS_FILE), "w", encoding="utf-8") as f:
+            json.dump({'format': ATLAS_FORMAT, 'sheets': sheet_files, 'layers': entries}, f)
+    except Exception as e:
+        print(f"Ошибка сохранения атласа: {e}")
+    return layers
+
+def load_atlas(model_json, model_dir):
+    """Загрузка атласа модели (None, если его нет или он устарел)"""
+    atlas_dir = os.path.join(model_dir, ATLAS_DIR)
+    try:
+        with open(os.path.join(atlas_dir, ATLAS_FILE), "r", encoding="utf-8") as f:
+            atlas = json.load(f)
+        if atlas.get('format') != ATLAS_FORMAT:
+            return None
+        entries = atlas.get('layers', {})
+        sources = _model_sources(model_json, model_dir)
+        for key, (layer, fp) in sources.items():
+            entry = entries.get(key)
+            if entry is None or entry.get('source') != _source_info(fp):
+                return None
+
+        sheets = [Image.open(os.path.join(atlas_dir, name)).convert("RGBA")
+                  for name in atlas.get('sheets', [])]
+        layers = {}
+        for key in sources:
+            entry = entries[key]
+            frames = [sheets[s].crop((x, y, x + w, y + h)) for s, x, y, w, h in entry['frames']]
+            layers[key] = (frames, entry.get('durations', []))
+        return layers
+    except Exception:
+        return None
+
+def load_model_layers(model_json, model_dir):
+    """Изображения слоев модели из атласа (с пересборкой при необходимости).
+
+    Возвращает словарь имя слоя -> (кадры, длительности).
+    """
+    layers = load_atlas(model_json, model_dir)
+    if layers is None:
+        layers = build_atlas(model_json, model_dir)
+    result = {}
+    for layer in model_json.get("layers", []):
+        if not layer.get("file"):
+            continue
+        loaded = layers.get(_layer_key(layer))
+        if loaded is not None:
+            result[layer.get("name")] = loaded
+    return result
@@ -1,25 +1,66 @@
-import threading, time
+import threading, time, math
 import numpy as np
-import sounddevice as sd
 import sys
 import os
+from ringbuffer import AudioRingBuffer
+from clock import RealClock
+from scheduler import RateMeter
+
+try:
+    import sounddevice as sd
+except Exception as e:
+    # Без PortAudio процессор работает от stream_factory или в режиме симуляции
+    print("sounddevice недоступен:", e)
+    sd = None
+
+SAMPLERATE = 44100
+BLOCKSIZE = 512  # Уменьшенный размер блока для снижения задержки
+RING_BLOCKS = 16  # Емкость кольцевого буфера в блоках
+
+def block_level(data, noise_gate=0.0):
+    """Уровень блока отсчетов: RMS * 10, не больше 1.0, с подавлением шума"""
+    rms = np.sqrt(np.mean(data**2)) if len(data) else 0.0
+    level = min(1.0, float(rms)*10)
+    return level if level >= noise_gate else 0.0
 
 class AudioProcessor:
-    def __init__(self, callback=None, device=None):
+    # thread - уровень считает отдельный поток из кольцевого буфера,
+    # callback - прямо в callback PortAudio, без буфера и потока обработки
+    LEVEL_MODES = ("thread", "callback")
+
+    def __init__(self, callback=None, device=None, stream_factory=None, level_mode="thread", clock=None):
+        """stream_factory(callback=, samplerate=, blocksize=, channels=) -
+        источник блоков вместо sounddevice.InputStream (например,
+        audio_sources.SyntheticBlockSource).
+
+        В режиме level_mode="callback" функция callback вызывается из потока
+        PortAudio и должна быстро возвращать управление. clock задает темп
+        симуляции (с clock.VirtualClock она идет без пауз).
+        """
+        self.clock = clock or RealClock()
         self.callback = callback
+        self.stream_factory = stream_factory
+        if level_mode not in self.LEVEL_MODES:
+            print(f"Неизвестный режим расчета уровня: {level_mode}, используется thread")
+            level_mode = "thread"
+        self.level_mode = level_mode
         self.running = False
         self._level = 0.0
+        self.last_capture_time = None  # time.perf_counter() получения последнего блока
+        self._slot = (0.0, None)  # (уровень, время блока) - публикуется одним присваиванием
         self._thread = None
         self.device = device
         self.noise_gate_threshold = 0.01
         self.device_index = None  # Индекс устройства
+        self.ring = AudioRingBuffer(BLOCKSIZE * RING_BLOCKS)
+        self.block_rate = RateMeter()  # частота вызовов callback звуковой карты
 
         # Подавление вывода ошибок для EXE
         if getattr(sys, 'frozen', False):
             sys.stderr = open(os.devnull, 'w')
 
         # Получение индекса устройства по имени
-        if device and device != "По умолчанию":
+        if device and device != "По умолчанию" and sd is not None:
             devices = sd.query_devices()
             for i, dev in enumerate(devices):
                 if dev['name'] == device and dev['max_input_channels'] > 0:
@@ -51,55 +92,117 @@ class AudioProcessor:
         while self.running:
             t += 0.1
             level = (np.sin(t)+1)/2
-            self._level = level
-            if self.callback:
-                try:
-                    self.callback(level)
-                except:
-                    pass
-            time.sleep(0.05)
+            self._publish(level, time.perf_counter())
+            self.clock.sleep(0.05)
+
+    def get_level(self):
+        """Последний уровень и время его блока (time.perf_counter)"""
+        return self._slot
+
+    def get_stats(self):
+        """Частота блоков, очередь необработанных блоков и счетчики кольцевого буфера"""
+        ring = self.ring.stats()
+        return {
+            'running': self.running,
+            'level': self._level,
+            'level_mode': self.level_mode,
+            'callback_rate': self.block_rate.rate(),
+            'callbacks': self.block_rate.count,
+            # В режиме callback уровень считается сразу и очереди нет
+            'queue_depth': ring['available'] / BLOCKSIZE if self.level_mode == "thread" else 0.0,
+            'ring': ring,
+        }
+
+    def _publish(self, level, captured_at):
+        self._slot = (level, captured_at)
+        self._level = level
+        self.last_capture_time = captured_at
+        if self.callback:
+            try:
+                self.callback(level)
+            except:
+                pass
+
+    def _open_stream(self, callback):
+        """Поток блоков: stream_factory или устройство sounddevice"""
+        if self.stream_factory is not None:
+            return self.stream_factory(callback=callback, samplerate=SAMPLERATE,
+                                       blocksize=BLOCKSIZE, channels=1)
+        if sd is None:
+            raise RuntimeError("sounddevice не установлен")
+        device_params = {}
+        if self.device_index is not None:
+            device_params['device'] = self.device_index
+        return sd.InputStream(
+            channels=1,
+            callback=callback,
+            samplerate=SAMPLERATE,
+            blocksize=BLOCKSIZE,
+            **device_params
+        )
 
     def _capture_loop(self):
         """Основной цикл захвата аудио"""
-        import queue
-        q = queue.Queue()
-        
+        if self.level_mode == "callback":
+            self._callback_level_loop()
+            return
+        ring = self.ring
+        ring.reset()
+
         def callback(indata, frames, time_info, status):
-            """Аудио callback функция"""
+            """Аудио callback функция: только запись в кольцевой буфер"""
             if not self.running:
                 return
-            q.put(indata.copy())
-        
+            # Время получения блока нужно для замера задержки до экрана
+            ring.write(indata, time.perf_counter())
+            self.block_rate.tick()
+
+        # Нет данных дольше нескольких блоков - underrun
+        timeout = BLOCKSIZE / SAMPLERATE * 4
         try:
-            device_params = {}
-            if self.device_index is not None:
-                device_params['device'] = self.device_index
-                
-            with sd.InputStream(
-                channels=1, 
-                callback=callback, 
-                samplerate=44100, 
-                blocksize=512,  # Уменьшенный размер блока для снижения задержки
-                **device_params
-            ):
+            with self._open_stream(callback):
                 while self.running:
-                    try:
-                        data = q.get(timeout=0.5)
-                    except queue.Empty:
+                    if not ring.wait(timeout):
                         continue
-                    rms = np.sqrt(np.mean(data**2))
-                    level = min(1.0, rms*10)
-                    
-                    # Применение подавления шума
-                    if level < self.noise_gate_threshold:
-                        level = 0.0
-                    
-                    self._level = level
-                    if self.callback:
-                        try:
-                            self.callback(level)
-                        except:
-                            pass
+                    captured_at = ring.written_at
+                    # Отставший поток обработки берет только последний блок
+                    data = ring.read_latest(BLOCKSIZE)
+                    self._publish(block_level(data, self.noise_gate_threshold), captured_at)
+        except Exception as e:
+            print("Ошибка захвата аудио:", e)
+            self._simulate_loop()
+
+    def _callback_level_loop(self):
+        """Расчет уровня прямо в callback PortAudio.
+
+        Блок копируется в заранее выделенный буфер, энергия считается
+        скалярным произведением без временных массивов. Поток только
+        держит устройство открытым.
+        """
+        scratch = np.zeros(BLOCKSIZE, dtype=np.float32)
+
+        def callback(indata, frames, time_info, status):
+            nonlocal scratch
+            if not self.running or not frames:
+                return
+            captured_at = time.perf_counter()
+            self.block_rate.tick()
+            if frames > len(scratch):
+                scratch = np.zeros(frames, dtype=np.float32)
+            block = scratch[:frames]
+            np.copyto(block, indata[:frames, 0])
+            rms = math.sqrt(float(np.dot(block, block)) / frames)
+            level = min(1.0, rms*10)
+
+            # Применение подавления шума
+            if level < self.noise_gate_threshold:
+                level = 0.0
+            self._publish(level, captured_at)
+
+        try:
+            with self._open_stream(callback):
+                while self.running:
+                    time.sleep(0.1)
         except Exception as e:
             print("Ошибка захвата аудио:", e)
             self._simulate_loop()
\ No newline at end of file
@@ -0,0 +1,166 @@
+import os, threading, time, wave
+import numpy as np
+
+# Форматы сырого PCM: имя -> (тип отсчета, множитель в диапазон -1..1, смещение)
+RAW_DTYPES = {
+    'uint8': (np.uint8, 1 / 128.0, -128),
+    'int16': (np.int16, 1 / 32768.0, 0),
+    'int32': (np.int32, 1 / 2147483648.0, 0),
+    'float32': (np.float32, 1.0, 0),
+}
+
+class BlockSource:
+    """Источник блоков звука без звуковой карты.
+
+    Повторяет интерфейс sounddevice.InputStream, которым пользуется
+    AudioProcessor: контекстный менеджер, который вызывает
+    callback(indata, frames, time_info, status) для каждого блока формы
+    (frames, channels) из blocks(). realtime=False отдает блоки без пауз.
+    """
+    def __init__(self, callback=None, samplerate=44100, blocksize=512, channels=1, realtime=True):
+        self.callback = callback
+        self.samplerate = samplerate
+        self.blocksize = blocksize
+        self.channels = channels
+        self.realtime = realtime
+        self.produced = 0
+        self._running = False
+        self._thread = None
+
+    def blocks(self):
+        """Блоки float32 формы (frames, channels) в диапазоне -1..1"""
+        raise NotImplementedError
+
+    def _run(self):
+        deadline = time.perf_counter()
+        for block in self.blocks():
+            if not self._running:
+                break
+            if self.realtime:
+                deadline += len(block) / self.samplerate
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.callback(block, len(block), None, None)
+            self.produced += 1
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def join(self, timeout=None):
+        """Ожидание окончания блоков"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+class SyntheticBlockSource(BlockSource):
+    """Синус frequency Гц, громкость которого меняется огибающей
+    envelope_hz от 0 до amplitude. Как и PortAudio, источник
+    переиспользует массив блока между вызовами; blocks ограничивает их число.
+    """
+    def __init__(self, callback=None, samplerate=44100, blocksize=512, channels=1,
+                 frequency=220.0, amplitude=0.1, envelope_hz=0.5, realtime=True, blocks=None):
+        super().__init__(callback, samplerate, blocksize, channels, realtime)
+        self.frequency = frequency
+        self.amplitude = amplitude
+        self.envelope_hz = envelope_hz
+        self.count = blocks
+        self._block = np.zeros((blocksize, channels), dtype=np.float32)
+
+    def fill(self, index):
+        """Блок с номером index"""
+        t = (np.arange(self.blocksize) + index * self.blocksize) / self.samplerate
+        envelope = (1 - np.cos(2 * np.pi * self.envelope_hz * t)) / 2
+        self._block[:] = (self.amplitude * envelope * np.sin(2 * np.pi * self.frequency * t))[:, None]
+        return self._block
+
+    def blocks(self):
+        index = 0
+        while self.count is None or index < self.count:
+            yield self.fill(index)
+            index += 1
+
+class FileBlockSource(BlockSource):
+    """Блоки из WAV-файла или файла сырого PCM, читаемого по частям.
+
+    Для WAV частота и число каналов берутся из заголовка, для сырого PCM
+    (raw=True) - из samplerate, channels и dtype (см. RAW_DTYPES).
+    Параметр samplerate от AudioProcessor для WAV игнорируется.
+    """
+    def __init__(self, callback=None, samplerate=44100, blocksize=512, channels=1,
+                 path=None, raw=False, dtype='int16', realtime=True):
+        super().__init__(callback, samplerate, blocksize, channels, realtime)
+        self.path = path
+        self.raw = raw
+        if raw:
+            if dtype not in RAW_DTYPES:
+                raise ValueError(f"Неизвестный формат PCM: {dtype}")
+            self.dtype = dtype
+            self.sample_width = np.dtype(RAW_DTYPES[dtype][0]).itemsize
+        else:
+            with wave.open(path, 'rb') as wav:
+                if wav.getcomptype() != 'NONE':
+                    raise ValueError(f"Сжатый WAV не поддерживается: {wav.getcompname()}")
+                self.samplerate = wav.getframerate()
+                self.channels = wav.getnchannels()
+                self.sample_width = wav.getsampwidth()
+            self.dtype = {1: 'uint8', 2: 'int16', 3: 'int24', 4: 'int32'}.get(self.sample_width)
+            if self.dtype is None:
+                raise ValueError(f"Неподдерживаемая разрядность WAV: {self.sample_width * 8} бит")
+
+    @property
+    def frame_count(self):
+        """Длина файла в отсчетах на канал"""
+        if self.raw:
+            return os.path.getsize(self.path) // (self.sample_width * self.channels)
+        with wave.open(self.path, 'rb') as wav:
+            return wav.getnframes()
+
+    def _decode(self, data):
+        if self.dtype == 'int24':
+            # 24 бита дополняются младшим нулевым байтом до int32
+            raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            padded = np.zeros((len(raw), 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            samples = padded.view('<i4').ravel().astype(np.float32) / 2147483648.0
+        else:
+            dtype, scale, offset = RAW_DTYPES[self.dtype]
+            samples = np.frombuffer(data, dtype=dtype).astype(np.float32)
+            if offset:
+                samples += offset
+            samples *= scale
+        return samples.reshape(-1, self.channels)
+
+    def blocks(self):
+        frame_bytes = self.sample_width * self.channels
+        if self.raw:
+            with open(self.path, 'rb') as f:
+                while True:
+                    data = f.read(self.blocksize * frame_bytes)
+                    data = data[:len(data) - len(data) % frame_bytes]
+                    if not data:
+                        break
+                    yield self._decode(data)
+        else:
+            with wave.open(self.path, 'rb') as wav:
+                while True:
+                    data = wav.readframes(self.blocksize)
+                    if not data:
+                        break
+                    yield self._decode(data)
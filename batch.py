@@ -0,0 +1,171 @@
+import os, sys, json, math, argparse, tempfile
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+
+from audio import block_level
+from audio_sources import FileBlockSource, RAW_DTYPES
+from clock import VirtualClock
+from compositor import create_compositor
+from renderer import Renderer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ANIMATION_FORMATS = {'.webp': 'WEBP', '.png': 'PNG', '.apng': 'PNG'}
+
+def audio_levels(source, fps, sensitivity=1.0, noise_gate=0.01):
+    """Уровень звука для каждого кадра.
+
+    Файл читается по блокам; кадр в момент t получает уровень последнего
+    блока, закончившегося к t, как и при живом захвате.
+    """
+    levels = []
+    current = 0.0
+    position = 0  # отсчетов прочитано
+    for block in source.blocks():
+        position += len(block)
+        # Кадры до конца этого блока еще видят уровень предыдущего
+        while len(levels) * source.samplerate < position * fps:
+            levels.append(current)
+        current = block_level(block[:, 0], noise_gate) * sensitivity
+    return levels
+
+def create_renderer(settings, width, height, fps, clock, seed=None):
+    """Рендерер с настройками приложения из settings.json"""
+    renderer = Renderer(width=width, height=height, fps=fps, clock=clock, seed=seed)
+    renderer.set_compositor(create_compositor(settings.get('compositor', 'pillow')))
+    pulse = settings.get('pulse', {})
+    renderer.set_pulse(pulse.get('steps', 33), pulse.get('resample', 'LANCZOS'), pulse.get('cache_mb', 64))
+    renderer.set_effects(settings.get('effects', {}))
+    if 'thresholds' in settings:
+        renderer.set_thresholds(settings['thresholds'])
+    if 'active_states' in settings:
+        renderer.set_active_states(settings['active_states'])
+    renderer.set_noise_gate(0.01 if settings.get('noise_gate_enabled', True) else 0.0)
+    renderer.set_idle(settings.get('idle_enabled', False), settings.get('idle_timeout', 60.0),
+                      settings.get('idle_fade', 1.0))
+    return renderer
+
+def render_range(job):
+    """Рендер кадров [start, end) в папку (в отдельном процессе).
+
+    Таймеры моргания, кадры GIF и эффекты зависят от всей истории сцены,
+    поэтому кадры до start проигрываются без композиции с тем же зерном
+    генератора случайных чисел: результат не зависит от разбиения на части.
+    """
+    fps = job['fps']
+    clock = VirtualClock(0.0)
+    renderer = create_renderer(job['settings'], job['width'], job['height'], fps, clock, job['seed'])
+    with open(os.path.join(job['model_dir'], 'model.json'), 'r', encoding='utf-8') as f:
+        model = json.load(f)
+    renderer.load_model(model, job['model_dir'], wait=True)
+
+    levels = job['levels']
+    start, end = job['start'], job['end']
+    for index in range(end):
+        clock.set(index / fps)
+        renderer.set_audio_level(levels[index])
+        img = renderer.render_frame(compose=index >= start)
+        if img is not None:
+            img.save(os.path.join(job['out_dir'], f"frame_{index:06d}.png"), compress_level=1)
+    return end - start
+
+class FrameFiles:
+    """Последовательность кадров, которые открываются при обращении.
+
+    Pillow принимает append_images только как последовательность, а
+    держать открытыми тысячи файлов кадров нельзя.
+    """
+    def __init__(self, paths):
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        with Image.open(self.paths[index]) as img:
+            img.load()
+        return img
+
+    def __iter__(self):
+        for index in range(len(self.paths)):
+            yield self[index]
+
+def save_animation(frames_dir, count, output, fps):
+    """Сборка кадров в анимированный WebP или APNG"""
+    paths = [os.path.join(frames_dir, f"frame_{i:06d}.png") for i in range(count)]
+    fmt = ANIMATION_FORMATS[os.path.splitext(output)[1].lower()]
+    options = {'lossless': True} if fmt == 'WEBP' else {}
+    with Image.open(paths[0]) as first:
+        first.save(output, format=fmt, save_all=True, append_images=FrameFiles(paths[1:]),
+                   duration=int(round(1000 / fps)), loop=0, **options)
+
+def render(model_dir, audio_path, output, fps=30, width=700, height=700, settings=None,
+           workers=None, seed=0, raw=False, samplerate=44100, channels=1, dtype='int16'):
+    """Пакетный рендер модели под звук из файла.
+
+    output - папка для последовательности PNG или файл .webp/.png/.apng
+    для анимации. Время виртуальное: рендер идет быстрее реального, а
+    непересекающиеся отрезки кадров распределяются по процессам.
+    Возвращает число кадров.
+    """
+    settings = settings or {}
+    source = FileBlockSource(path=audio_path, raw=raw, samplerate=samplerate,
+                             channels=channels, dtype=dtype, realtime=False)
+    levels = audio_levels(source, fps, settings.get('sensitivity', 1.0),
+                          0.01 if settings.get('noise_gate_enabled', True) else 0.0)
+    count = len(levels)
+    if not count:
+        print("В аудиофайле нет отсчетов")
+        return 0
+
+    animated = os.path.splitext(output)[1].lower() in ANIMATION_FORMATS
+    temp_dir = tempfile.TemporaryDirectory() if animated else None
+    out_dir = temp_dir.name if animated else output
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        workers = max(1, min(workers or os.cpu_count() or 1, count))
+        chunk = math.ceil(count / workers)
+        jobs = [{'model_dir': model_dir, 'settings': settings, 'levels': levels,
+                 'start': start, 'end': min(count, start + chunk), 'fps': fps,
+                 'width': width, 'height': height, 'seed': seed, 'out_dir': out_dir}
+                for start in range(0, count, chunk)]
+        if len(jobs) == 1:
+            render_range(jobs[0])
+        else:
+            with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+                list(pool.map(render_range, jobs))
+        if animated:
+            save_animation(out_dir, count, output, fps)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+    return count
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный рендер модели под звук из файла")
+    parser.add_argument("model_dir", help="папка модели с model.json")
+    parser.add_argument("audio", help="WAV-файл или сырой PCM (с --raw)")
+    parser.add_argument("output", help="папка для кадров PNG или файл .webp/.png/.apng")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--width", type=int, default=700)
+    parser.add_argument("--height", type=int, default=700)
+    parser.add_argument("--settings", default=os.path.join(BASE_DIR, "settings.json"),
+                        help="настройки эффектов и порогов")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов (по умолчанию - все ядра)")
+    parser.add_argument("--seed", type=int, default=0, help="зерно случайных эффектов")
+    parser.add_argument("--raw", action="store_true", help="сырой PCM вместо WAV")
+    parser.add_argument("--samplerate", type=int, default=44100, help="частота сырого PCM")
+    parser.add_argument("--channels", type=int, default=1, help="число каналов сырого PCM")
+    parser.add_argument("--dtype", default="int16", choices=sorted(RAW_DTYPES), help="формат сырого PCM")
+    args = parser.parse_args(argv)
+
+    settings = {}
+    if os.path.exists(args.settings):
+        with open(args.settings, 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+    count = render(args.model_dir, args.audio, args.output, args.fps, args.width, args.height,
+                   settings, args.workers, args.seed, args.raw, args.samplerate, args.channels, args.dtype)
+    print(f"Кадров: {count}")
+    return 0 if count else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
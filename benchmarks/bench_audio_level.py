@@ -0,0 +1,69 @@
+"""Сравнение режимов расчета уровня звука.
+
+Замеряет стоимость расчета уровня блока через np.mean(data**2) и через
+скалярное произведение в заранее выделенном буфере, сверяет результаты и
+запускает AudioProcessor от синтетического источника в режимах thread и
+callback, измеряя задержку от получения блока до вызова callback
+приложения. При расхождении уровней завершается с кодом 1.
+
+    python benchmarks/bench_audio_level.py [--blocks N] [--seconds S]
+"""
+import os, sys, time, math, argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_sources import SyntheticBlockSource
+from audio import AudioProcessor, BLOCKSIZE
+from scheduler import FrameTimeHistogram
+
+def timed(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+def run_processor(level_mode, seconds):
+    delays = FrameTimeHistogram()
+    processor = None
+
+    def on_level(level):
+        delays.add(time.perf_counter() - processor.last_capture_time)
+
+    processor = AudioProcessor(callback=on_level, stream_factory=SyntheticBlockSource,
+                               level_mode=level_mode)
+    processor.start()
+    time.sleep(seconds)
+    processor.stop()
+    return delays.stats()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сравнение режимов расчета уровня звука")
+    parser.add_argument("--blocks", type=int, default=20000, help="число блоков на замер")
+    parser.add_argument("--seconds", type=float, default=1.0, help="длительность прогона каждого режима")
+    args = parser.parse_args(argv)
+
+    indata = np.random.default_rng(1).standard_normal((BLOCKSIZE, 1)).astype(np.float32) * 0.05
+    scratch = np.zeros(BLOCKSIZE, dtype=np.float32)
+
+    def with_temporary():
+        data = indata
+        return np.sqrt(np.mean(data**2))
+
+    def in_place():
+        np.copyto(scratch, indata[:, 0])
+        return math.sqrt(float(np.dot(scratch, scratch)) / BLOCKSIZE)
+
+    diff = abs(float(with_temporary()) - in_place())
+    print(f"расхождение RMS: {diff:.2e}")
+    print(f"np.mean(data**2):        {timed(with_temporary, args.blocks):7.2f} мкс на блок")
+    print(f"np.dot в буфере:         {timed(in_place, args.blocks):7.2f} мкс на блок")
+    print()
+    print(f"{'режим':<10} {'блоков':>8} {'p50, мс':>9} {'p95, мс':>9} {'max, мс':>9}")
+    for mode in AudioProcessor.LEVEL_MODES:
+        stats = run_processor(mode, args.seconds)
+        print(f"{mode:<10} {stats['count']:>8} {stats['p50']:>9.3f} {stats['p95']:>9.3f} {stats['max']:>9.3f}")
+    return 0 if diff < 1e-5 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
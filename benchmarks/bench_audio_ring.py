@@ -0,0 +1,47 @@
+"""Замер кольцевого буфера звука.
+
+Сравнивает стоимость передачи блока через queue.Queue с копированием и
+через AudioRingBuffer. Корректность буфера (окна на стыке кольца,
+переполнения, работа AudioProcessor от синтетического источника)
+проверяют тесты tests/test_ringbuffer.py.
+
+    python benchmarks/bench_audio_ring.py [--blocks N]
+"""
+import os, sys, time, queue, argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ringbuffer import AudioRingBuffer
+from audio import BLOCKSIZE
+
+def timed(func, count):
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - start) / count * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер кольцевого буфера звука")
+    parser.add_argument("--blocks", type=int, default=20000, help="число блоков на замер")
+    args = parser.parse_args(argv)
+
+    block = np.random.default_rng(1).standard_normal((BLOCKSIZE, 1)).astype(np.float32)
+    q = queue.Queue()
+
+    def through_queue():
+        q.put(block.copy())
+        q.get()
+
+    ring = AudioRingBuffer(BLOCKSIZE * 16)
+
+    def through_ring():
+        ring.write(block)
+        ring.read_latest(BLOCKSIZE)
+
+    print(f"queue + copy:  {timed(through_queue, args.blocks):7.2f} мкс на блок")
+    print(f"кольцо:        {timed(through_ring, args.blocks):7.2f} мкс на блок")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
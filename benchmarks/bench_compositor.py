@@ -0,0 +1,51 @@
+"""Замер компоновщиков слоев.
+
+Собирает синтетическую сцену из полупрозрачных слоев и измеряет время
+композиции PillowCompositor и NumpyCompositor. Совпадение результатов
+проверяют тесты tests/test_compositor.py.
+
+    python benchmarks/bench_compositor.py [--layers N] [--frames N]
+"""
+import os, sys, time, argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compositor import PillowCompositor, NumpyCompositor
+from tests.scenes import WIDTH, HEIGHT, make_draws
+
+def timed(func, frames):
+    func()
+    start = time.perf_counter()
+    for _ in range(frames):
+        func()
+    return (time.perf_counter() - start) / frames * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер компоновщиков слоев")
+    parser.add_argument("--layers", type=int, default=12, help="число слоев сцены")
+    parser.add_argument("--frames", type=int, default=30, help="число кадров на замер")
+    parser.add_argument("--content", type=float, default=0.5,
+                        help="доля стороны слоя, занятая непрозрачным рисунком")
+    args = parser.parse_args(argv)
+
+    pillow = PillowCompositor()
+    numpy_comp = NumpyCompositor()
+    draws = make_draws(args.layers, args.content)
+
+    pulse = [(name, image, px, py, (int(size[0] * 1.07), int(size[1] * 1.07)))
+             for name, image, px, py, size in draws]
+    print(f"{'операция':<28} {'pillow, мс':>12} {'numpy, мс':>12}")
+    bases = {c.name: c.compose(draws, WIDTH, HEIGHT) for c in (pillow, numpy_comp)}
+    rows = [
+        ("композиция", lambda c: c.to_image(c.compose(draws, WIDTH, HEIGHT))),
+        ("область 120x80", lambda c: c.compose_region(bases[c.name], draws, (300, 200, 420, 280))),
+        ("яркость", lambda c: c.to_image(c.brightness(bases[c.name], 0.5))),
+        ("пульсация", lambda c: c.to_image(c.compose(pulse, WIDTH, HEIGHT))),
+    ]
+    for name, func in rows:
+        print(f"{name:<28} {timed(lambda: func(pillow), args.frames):>12.2f} "
+              f"{timed(lambda: func(numpy_comp), args.frames):>12.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,357 @@
+"""Набор замеров конвейера рендер -> кодирование -> раздача.
+
+Работает без Tk и звуковой карты. Загружает models/slot1 и синтетические
+модели на сотни слоев с GIF и измеряет:
+
+- время load_model (первая загрузка со сборкой атласа и повторная);
+- время кадра Renderer.render_frame без эффектов и с дрожанием,
+  прыжками, пульсацией и idle-режимом (виртуальные часы, фиксированное
+  зерно - прогоны сравнимы между коммитами);
+- время кодирования и размер кадра для каждого формата из encoders;
+- пропускную способность /stream WebServer на N одновременных клиентов.
+
+Результаты пишутся в JSON; с --compare печатается сравнение с прошлым
+прогоном, и при ухудшении больше --threshold процентов скрипт завершается
+с кодом 1.
+
+    python benchmarks/bench_pipeline.py [--output results.json] [--compare old.json]
+"""
+import os, sys, json, math, time, shutil, socket, random, tempfile, platform, argparse, threading, subprocess
+import http.client
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import layer_cache
+from layer_cache import LayerCache
+from clock import VirtualClock
+from encoders import ENCODERS, create_encoder
+from renderer import Renderer
+from scheduler import FrameTimeHistogram
+from webserver import WebServer
+from tests.scenes import make_layer
+
+SLOT1 = os.path.join(ROOT, "models", "slot1")
+
+# Эффекты для замера кадра; idle - затемнение без звука
+EFFECTS = {
+    "none": {"blink": True},
+    "shake": {"blink": True, "shake": True},
+    "bounce": {"blink": True, "bounce": True},
+    "pulse": {"blink": True, "pulse": True},
+    "idle": {"blink": True},
+}
+
+def write_synthetic_model(model_dir, layer_count, gif_layers, gif_frames, seed=1):
+    """Модель из layer_count PNG-слоев и gif_layers GIF-слоев по gif_frames кадров.
+
+    Каждые 4 слоя первой половины образуют группу с логикой состояний
+    голоса, как в обычных моделях.
+    """
+    rng = np.random.default_rng(seed)
+    rand = random.Random(seed)
+    layers = []
+    groups = []
+    for i in range(layer_count + gif_layers):
+        name = f"layer{i}"
+        size = (rand.randint(60, 300), rand.randint(60, 300))
+        is_gif = i >= layer_count
+        if is_gif:
+            frames = [make_layer(rng, size, 0.6) for _ in range(gif_frames)]
+            frames[0].save(os.path.join(model_dir, f"{name}.gif"), save_all=True,
+                           append_images=frames[1:], duration=80, loop=0, disposal=2)
+            file_name = f"{name}.gif"
+        else:
+            make_layer(rng, size, 0.6).save(os.path.join(model_dir, f"{name}.png"))
+            file_name = f"{name}.png"
+        layer = {"name": name, "file": file_name, "x": rand.randint(-200, 200),
+                 "y": rand.randint(-200, 200), "visible": True, "is_gif": is_gif,
+                 "scale": 1.0, "rotation": 0, "group": None}
+        if i < layer_count // 2:
+            group_name = f"group{i // 4}"
+            layer["group"] = group_name
+            if i % 4 == 0:
+                groups.append({"name": group_name, "children": [], "logic": {"silent": name},
+                               "blink_freq": 3.0})
+            groups[-1]["children"].append(name)
+            if i % 4 == 1:
+                groups[-1]["logic"]["normal"] = name
+        layers.append(layer)
+    model = {"name": f"synthetic{layer_count}", "layers": layers, "groups": groups}
+    with open(os.path.join(model_dir, "model.json"), "w", encoding="utf-8") as f:
+        json.dump(model, f)
+    return model
+
+def read_model(model_dir):
+    with open(os.path.join(model_dir, "model.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def bench_load(model, model_dir, repeats):
+    """Первая загрузка модели (с атласом и кэшем слоев) и медиана повторных"""
+    renderer = Renderer()
+    renderer.load_model(model, model_dir, wait=True)
+    cold = renderer.get_load_stats()['load_ms']
+    warm = []
+    for _ in range(repeats):
+        renderer.load_model(model, model_dir, wait=True)
+        warm.append(renderer.get_load_stats()['load_ms'])
+    return {'cold_ms': cold, 'warm_ms': sorted(warm)[len(warm) // 2]}
+
+def bench_frames(model, model_dir, effect, frames, fps=60):
+    """Время render_frame по виртуальной временной линии с меняющимся уровнем звука"""
+    clock = VirtualClock(0.0)
+    renderer = Renderer(clock=clock, seed=1)
+    renderer.load_model(model, model_dir, wait=True)
+    renderer.set_effects(EFFECTS[effect])
+    idle = effect == "idle"
+    if idle:
+        renderer.set_idle(True, 0.0, fade=0.25)
+    histogram = FrameTimeHistogram(frames)
+    for i in range(frames + 10):
+        clock.set(i / fps)
+        # Уровень плавно проходит все состояния голоса; в idle - тишина
+        renderer.set_audio_level(0.0 if idle else (math.sin(i / 7) + 1) / 2)
+        start = time.perf_counter()
+        renderer.render_frame()
+        if i >= 10:
+            histogram.add(time.perf_counter() - start)
+    return histogram.stats()
+
+def bench_encoders(model, model_dir, frames):
+    """Время кодирования и размер кадра модели для каждого формата"""
+    renderer = Renderer(clock=VirtualClock(0.0), seed=1)
+    renderer.load_model(model, model_dir, wait=True)
+    img = renderer.render_frame()
+    results = {}
+    for name in ENCODERS:
+        encoder = create_encoder({'format': name})
+        try:
+            encoder.encode(img)
+        except Exception as e:
+            results[name] = {'error': str(e)}
+            continue
+        histogram = FrameTimeHistogram(frames)
+        for _ in range(frames):
+            start = time.perf_counter()
+            data = encoder.encode(img)
+            histogram.add(time.perf_counter() - start)
+        results[name] = {'encode_ms': histogram.stats(), 'bytes': len(data)}
+    return results
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def read_stream(port, seconds, result):
+    """Клиент /stream: читает multipart-кадры seconds секунд"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    frames = size = 0
+    try:
+        conn.request("GET", "/stream")
+        resp = conn.getresponse()
+        resp.readline()  # первая граница
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            length = None
+            while True:
+                line = resp.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if not line:
+                    break
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            resp.read(length)
+            resp.readline()  # \r\n после кадра
+            resp.readline()  # граница
+            frames += 1
+            size += length
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        result['frames'] = frames
+        result['bytes'] = size
+        conn.close()
+
+def bench_stream(model, model_dir, client_counts, seconds, encoder_config, fps=60):
+    """Кадры в секунду и трафик /stream при N одновременных клиентах.
+
+    Дрожание при постоянном уровне звука меняет сцену на каждом тике,
+    поэтому рендерер кодирует каждый кадр.
+    """
+    renderer = Renderer(fps=fps, seed=1)
+    renderer.set_encoder(create_encoder(encoder_config))
+    renderer.load_model(model, model_dir, wait=True)
+    renderer.set_effects({"blink": True, "shake": True})
+    renderer.set_audio_level(0.5)
+    renderer.start()
+    port = free_port()
+    server = WebServer(renderer, host="127.0.0.1", port=port)
+    server.start()
+    deadline = time.perf_counter() + 10
+    while time.perf_counter() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+
+    results = {}
+    try:
+        for count in client_counts:
+            clients = [{} for _ in range(count)]
+            threads = [threading.Thread(target=read_stream, args=(port, seconds, c), daemon=True)
+                       for c in clients]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join(seconds + 10)
+            elapsed = time.perf_counter() - start
+            client_fps = [c.get('frames', 0) / seconds for c in clients]
+            results[f"clients_{count}"] = {
+                'client_fps': sum(client_fps) / count,
+                'min_client_fps': min(client_fps),
+                'total_mbps': sum(c.get('bytes', 0) for c in clients) * 8 / elapsed / 1e6,
+                'errors': sum(1 for c in clients if 'error' in c),
+            }
+            # Сервер замечает отключение клиентов при следующей записи
+            time.sleep(0.5)
+    finally:
+        server.stop()
+        renderer.stop()
+    results['target_fps'] = fps
+    return results
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, timeout=30).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return None
+
+def flatten(data, prefix=""):
+    """Числовые значения вложенного словаря по путям вида a.b.c"""
+    items = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            items.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            items[path] = value
+    return items
+
+def compare(old, new, threshold):
+    """Печать изменений метрик; возвращает пути ухудшившихся метрик.
+
+    Для путей с "_ms" меньше - лучше, для "fps" и "mbps" - больше.
+    """
+    old_items, new_items = flatten(old['results']), flatten(new['results'])
+    regressions = []
+    print(f"\nСравнение с {old['meta'].get('commit')} (порог {threshold:.0f}%):")
+    for path in sorted(new_items):
+        if path not in old_items or path.endswith('.count'):
+            continue
+        before, after = old_items[path], new_items[path]
+        if "_ms" in path:
+            worse = after > before
+        elif "fps" in path or "mbps" in path:
+            worse = after < before
+        else:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        mark = ""
+        if worse and abs(change) > threshold:
+            mark = "  УХУДШЕНИЕ"
+            regressions.append(path)
+        print(f"{path:<55} {before:>10.2f} -> {after:>10.2f} {change:>+7.1f}%{mark}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры конвейера рендер -> кодирование -> раздача")
+    parser.add_argument("--output", default=None, help="файл JSON с результатами")
+    parser.add_argument("--compare", default=None, help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=10.0, help="порог ухудшения, проценты")
+    parser.add_argument("--layers", default="100,300", help="размеры синтетических моделей")
+    parser.add_argument("--gif-layers", type=int, default=4, help="GIF-слоев в синтетической модели")
+    parser.add_argument("--gif-frames", type=int, default=16, help="кадров в каждом GIF")
+    parser.add_argument("--frames", type=int, default=120, help="кадров на замер эффекта")
+    parser.add_argument("--load-repeats", type=int, default=3, help="повторных загрузок модели")
+    parser.add_argument("--clients", default="1,4,16", help="числа клиентов /stream")
+    parser.add_argument("--stream-seconds", type=float, default=3.0, help="длительность замера /stream")
+    parser.add_argument("--stream-format", default="png", help="формат кадров /stream")
+    args = parser.parse_args(argv)
+
+    results = {'load': {}, 'frame_ms': {}}
+    with tempfile.TemporaryDirectory() as temp:
+        # Кэш слоев синтетических моделей не попадает в кэш приложения
+        layer_cache._default_cache = LayerCache(os.path.join(temp, "cache"))
+        # Копия slot1 без атласа: первая загрузка действительно холодная,
+        # и замер ничего не пишет в папку модели
+        slot1_dir = os.path.join(temp, "slot1")
+        shutil.copytree(SLOT1, slot1_dir, ignore=shutil.ignore_patterns(".atlas"))
+        models = {"slot1": (read_model(slot1_dir), slot1_dir)}
+        for count in (int(n) for n in args.layers.split(",") if n):
+            model_dir = os.path.join(temp, f"synthetic{count}")
+            os.makedirs(model_dir)
+            model = write_synthetic_model(model_dir, count, args.gif_layers, args.gif_frames)
+            models[f"synthetic{count}"] = (model, model_dir)
+
+        for name, (model, model_dir) in models.items():
+            results['load'][name] = bench_load(model, model_dir, args.load_repeats)
+            print(f"load_model {name}: {results['load'][name]['cold_ms']:.1f} мс, "
+                  f"повторно {results['load'][name]['warm_ms']:.1f} мс")
+            results['frame_ms'][name] = {}
+            for effect in EFFECTS:
+                stats = bench_frames(model, model_dir, effect, args.frames)
+                results['frame_ms'][name][effect] = stats
+                print(f"  кадр {effect:<7} p50 {stats['p50']:7.2f} мс  p95 {stats['p95']:7.2f} мс")
+
+        model, model_dir = models["slot1"]
+        results['encode'] = bench_encoders(model, model_dir, args.frames // 4 or 1)
+        for name, stats in results['encode'].items():
+            if 'error' in stats:
+                print(f"кодирование {name:<5} ошибка: {stats['error']}")
+            else:
+                print(f"кодирование {name:<5} p50 {stats['encode_ms']['p50']:7.2f} мс  {stats['bytes']} байт")
+
+        clients = [int(n) for n in args.clients.split(",") if n]
+        results['stream'] = bench_stream(model, model_dir, clients, args.stream_seconds,
+                                         {'format': args.stream_format, 'compress_level': 1}
+                                         if args.stream_format == "png" else {'format': args.stream_format})
+        for key, stats in results['stream'].items():
+            if isinstance(stats, dict):
+                print(f"/stream {key:<11} {stats['client_fps']:6.1f} кадр/с на клиента, "
+                      f"{stats['total_mbps']:7.1f} Мбит/с, ошибок {stats['errors']}")
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nРезультаты: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        if compare(old, report, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Замер покадровых накладных расходов сборки сцены.
+
+Строит синтетические модели на 10, 100 и 1000 слоев с маленькими
+изображениями в памяти и измеряет время Renderer._build_scene на кадр,
+без композиции и кодирования.
+
+    python benchmarks/bench_render_plan.py [--frames N]
+"""
+import os, sys, time, argparse
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from render_plan import compile_render_plan
+from renderer import Renderer
+
+def make_model(layer_count, group_size=4):
+    """Модель из layer_count слоев, часть из которых собрана в группы"""
+    layers = []
+    groups = []
+    images = {}
+    for i in range(layer_count):
+        name = f"layer{i}"
+        layer = {"name": name, "file": f"{name}.png", "x": i % 50, "y": i % 30, "visible": True}
+        # Каждые group_size слоев из первой половины образуют группу
+        if i < layer_count // 2:
+            group_name = f"group{i // group_size}"
+            layer["group"] = group_name
+            if i % group_size == 0:
+                groups.append({
+                    "name": group_name,
+                    "children": [],
+                    "logic": {"silent": name},
+                    "blink_freq": 3.0,
+                })
+            groups[-1]["children"].append(name)
+            if i % group_size == 1:
+                groups[-1]["logic"]["normal"] = name
+        layers.append(layer)
+        images[name] = Image.new("RGBA", (16, 16), (i % 256, 0, 0, 255))
+    return {"name": f"bench{layer_count}", "layers": layers, "groups": groups}, images
+
+def bench(layer_count, frames):
+    model, images = make_model(layer_count)
+    renderer = Renderer()
+    renderer.set_effects({'blink': True, 'bounce': True})
+    plan = compile_render_plan(model, "", 1, images, {}, {}, renderer.width, renderer.height)
+    renderer._pending_plan = (plan, time.perf_counter(), 0.0)
+    renderer._install_pending_plan()
+    renderer.set_audio_level(0.3)
+
+    for _ in range(10):
+        renderer._build_scene()
+    start = time.perf_counter()
+    for _ in range(frames):
+        renderer._build_scene()
+    return (time.perf_counter() - start) / frames
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер сборки сцены по плану отрисовки")
+    parser.add_argument("--frames", type=int, default=500, help="число кадров на замер")
+    args = parser.parse_args(argv)
+
+    print(f"{'слоев':>6} {'мкс/кадр':>10} {'мкс/слой':>10}")
+    for layer_count in (10, 100, 1000):
+        per_frame = bench(layer_count, args.frames)
+        print(f"{layer_count:>6} {per_frame * 1e6:>10.1f} {per_frame * 1e6 / layer_count:>10.2f}")
+
+if __name__ == "__main__":
+    main()
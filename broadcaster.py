@@ -0,0 +1,129 @@
+import threading, time
+
+class StreamClient:
+    """Подписчик на кадры рассылки.
+
+    Хранит номер последнего полученного кадра, число пропущенных кадров
+    и задержку между публикацией кадра и его получением клиентом.
+    Клиент с patches=True вместо полного кадра получает изменившиеся
+    области, если у него есть предыдущий кадр.
+    """
+    def __init__(self, broadcaster, name="", patches=False):
+        self.broadcaster = broadcaster
+        self.name = name
+        self.patches = patches
+        self.connected_at = time.time()
+        self.registered_at = time.perf_counter()
+        self.last_seq = 0
+        self.frames = 0
+        self.dropped = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+
+    def wait(self, timeout=1.0):
+        """Ожидание следующего кадра: (номер, байты, MIME-тип) или None"""
+        return self.broadcaster.wait_frame(self, timeout)
+
+    def wait_update(self, timeout=1.0):
+        """Ожидание следующего кадра: (номер, байты, MIME-тип, области) или None.
+
+        Области - список ((x0, y0, x1, y1), байты) относительно предыдущего
+        кадра клиента или None, если нужно показать полный кадр.
+        """
+        return self.broadcaster.wait_update(self, timeout)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'connected_for': time.time() - self.connected_at,
+            'last_seq': self.last_seq,
+            'frames': self.frames,
+            'dropped': self.dropped,
+            'last_lag_ms': self.last_lag * 1000,
+            'max_lag_ms': self.max_lag * 1000,
+        }
+
+class FrameBroadcaster:
+    """Рассылка кадров всем клиентам с одним кодированием.
+
+    Новый кадр кладется в общий слот, ожидающие клиенты просыпаются по
+    условной переменной. Медленный клиент не копит очередь, а сразу получает
+    последний кадр, пропущенные кадры учитываются в его статистике.
+    """
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._clients = []
+        self._seq = 0
+        self._data = None
+        self._mimetype = None
+        self._patches = None
+        self._published_at = 0.0
+
+    def publish(self, seq, data, mimetype, patches=None):
+        """Публикация нового кадра.
+
+        patches - закодированные изменившиеся области относительно кадра seq - 1
+        """
+        with self._cond:
+            self._seq = seq
+            self._data = data
+            self._mimetype = mimetype
+            self._patches = patches
+            self._published_at = time.perf_counter()
+            self._cond.notify_all()
+
+    def register(self, name="", patches=False):
+        """Подключение нового клиента"""
+        client = StreamClient(self, name, patches)
+        with self._cond:
+            self._clients.append(client)
+        return client
+
+    def unregister(self, client):
+        """Отключение клиента"""
+        with self._cond:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def client_count(self):
+        with self._cond:
+            return len(self._clients)
+
+    def patch_client_count(self):
+        """Количество клиентов, принимающих частичные обновления"""
+        with self._cond:
+            return sum(1 for c in self._clients if c.patches)
+
+    def wait_frame(self, client, timeout=1.0):
+        """Ожидание кадра новее последнего полученного клиентом"""
+        update = self.wait_update(client, timeout)
+        if update is None:
+            return None
+        return update[:3]
+
+    def wait_update(self, client, timeout=1.0):
+        """Ожидание кадра вместе с изменившимися областями"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._data is not None and self._seq != client.last_seq,
+                                timeout)
+            if self._data is None or self._seq == client.last_seq:
+                return None
+            if client.last_seq and self._seq > client.last_seq + 1:
+                client.dropped += self._seq - client.last_seq - 1
+            # Области годятся, только если клиент получил предыдущий кадр
+            patches = self._patches if client.last_seq == self._seq - 1 else None
+            client.last_seq = self._seq
+            client.frames += 1
+            # Кадр, опубликованный до подключения, клиент не ждал
+            if self._published_at >= client.registered_at:
+                client.last_lag = time.perf_counter() - self._published_at
+                client.max_lag = max(client.max_lag, client.last_lag)
+            return self._seq, self._data, self._mimetype, patches
+
+    def stats(self):
+        """Статистика по клиентам"""
+        with self._cond:
+            return {
+                'seq': self._seq,
+                'clients': [c.stats() for c in self._clients],
+            }
@@ -0,0 +1,70 @@
+import time
+
+class Clock:
+    """Часы анимации.
+
+    Рендерер, аудиопроцессор и редактор берут время таймеров моргания,
+    кадров GIF, случайных эффектов и idle-режима только из часов, поэтому
+    временную линию сцены можно подменить. Важны только разности
+    значений time(), а не их привязка к календарю.
+    """
+    name = ""
+
+    def time(self):
+        raise NotImplementedError
+
+    def sleep(self, seconds):
+        time.sleep(max(0.0, seconds))
+
+class RealClock(Clock):
+    """Системное время (time.time); сдвигается вместе с системными часами"""
+    name = "real"
+
+    def time(self):
+        return time.time()
+
+class MonotonicClock(Clock):
+    """Монотонное время: перевод системных часов не сбивает таймеры"""
+    name = "monotonic"
+
+    def time(self):
+        return time.monotonic()
+
+class VirtualClock(Clock):
+    """Время, которое двигается только явно.
+
+    sleep() не ждет, а сдвигает время, поэтому циклы на таких часах
+    проигрывают временную линию с максимальной скоростью.
+    """
+    name = "virtual"
+
+    def __init__(self, start=0.0):
+        self._now = float(start)
+
+    def time(self):
+        return self._now
+
+    def set(self, now):
+        self._now = float(now)
+
+    def advance(self, dt):
+        self._now += dt
+        return self._now
+
+    def sleep(self, seconds):
+        self.advance(max(0.0, seconds))
+
+# Часы, которые можно выбрать в settings.json. VirtualClock сам не идет,
+# поэтому его создают явно (пакетный рендер, замеры), а не по имени
+CLOCKS = {
+    "real": RealClock,
+    "monotonic": MonotonicClock,
+}
+
+def create_clock(name="real"):
+    """Создание часов по имени из CLOCKS (при неизвестном имени - системное время)"""
+    clock_cls = CLOCKS.get(str(name).lower())
+    if clock_cls is None:
+        print(f"Неизвестные часы: {name}, используется real")
+        return RealClock()
+    return clock_cls()
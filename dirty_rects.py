@@ -0,0 +1,91 @@
+# Прямоугольник изменившейся области кадра - кортеж (x0, y0, x1, y1)
+# с исключенными правой и нижней границами, как у box в Pillow
+
+def layer_rect(px, py, size):
+    """Прямоугольник слоя на холсте"""
+    return (px, py, px + size[0], py + size[1])
+
+def alpha_bbox(image):
+    """Непрозрачная область изображения (None, если оно целиком прозрачное)"""
+    if "A" not in image.getbands():
+        return (0, 0, image.width, image.height)
+    return image.getchannel("A").getbbox()
+
+def draw_rect(image, px, py, size, boxes=None):
+    """Прямоугольник видимой части слоя на холсте (None, если слой прозрачный).
+
+    boxes - непрозрачные области изображений плана (id -> bbox). Слои
+    моделей обычно нарисованы на прозрачном холсте размером с кадр, и
+    видимая часть намного меньше слоя. Для масштабированных слоев и
+    изображений вне плана берется весь прямоугольник слоя.
+    """
+    if boxes is not None and size == image.size:
+        key = id(image)
+        if key in boxes:
+            bbox = boxes[key]
+            return offset_rect(bbox, px, py) if bbox is not None else None
+    return layer_rect(px, py, size)
+
+def clip_rect(rect, width, height):
+    """Обрезка прямоугольника по холсту (None, если он целиком за краем)"""
+    x0, y0, x1, y1 = rect
+    x0, y0 = max(0, x0), max(0, y0)
+    x1, y1 = min(width, x1), min(height, y1)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return (x0, y0, x1, y1)
+
+def offset_rect(rect, dx, dy):
+    x0, y0, x1, y1 = rect
+    return (x0 + dx, y0 + dy, x1 + dx, y1 + dy)
+
+def rect_area(rect):
+    return (rect[2] - rect[0]) * (rect[3] - rect[1])
+
+def merge_rects(rects):
+    """Объединение пересекающихся и соприкасающихся прямоугольников.
+
+    Слои одной группы обычно лежат в одном месте, поэтому после слияния
+    остается несколько прямоугольников и ни один пиксель не рисуется дважды.
+    """
+    merged = list(rects)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for rect in merged:
+            for i, other in enumerate(result):
+                if (rect[0] <= other[2] and other[0] <= rect[2]
+                        and rect[1] <= other[3] and other[1] <= rect[3]):
+                    result[i] = (min(rect[0], other[0]), min(rect[1], other[1]),
+                                 max(rect[2], other[2]), max(rect[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(rect)
+        merged = result
+    return merged
+
+def diff_draws(previous, current, width, height, boxes=None):
+    """Изменившиеся области между двумя списками слоев сцены.
+
+    Слой описывается (имя, изображение, x, y, размер). Слой, который
+    появился, исчез, сменил кадр, позицию или размер, делает грязными свою
+    старую и новую области, ограниченные непрозрачной частью слоя (boxes,
+    см. draw_rect). Порядок слоев задается планом модели и при той же
+    модели не меняется.
+    """
+    def keys(draws):
+        return {(name, id(image), px, py, size): image for name, image, px, py, size in draws}
+
+    old, new = keys(previous), keys(current)
+    rects = []
+    for key in old.keys() ^ new.keys():
+        _, _, px, py, size = key
+        image = new[key] if key in new else old[key]
+        rect = draw_rect(image, px, py, size, boxes)
+        if rect is not None:
+            rect = clip_rect(rect, width, height)
+        if rect is not None:
+            rects.append(rect)
+    return merge_rects(rects)
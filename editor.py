@@ -10,6 +10,9 @@ import random
 import threading
 import sys
 from audio import AudioProcessor
+from layer_cache import get_layer_cache
+from compositor import create_compositor
+from clock import RealClock
 
 # Определение базовой директории
 if getattr(sys, 'frozen', False):
@@ -21,8 +24,9 @@ MODELS_DIR = os.path.join(BASE_DIR, "models")
 os.makedirs(MODELS_DIR, exist_ok=True)
 
 class CanvasItem:
-    def __init__(self, layer, image_path):
+    def __init__(self, layer, image_path, clock=None):
         self.layer = layer
+        self.clock = clock or RealClock()
         self.image_path = image_path
         self.is_gif = bool(layer.get("is_gif", False))
         self.scale = float(layer.get("scale", 1.0))
@@ -46,50 +50,26 @@ class CanvasItem:
         self.tkimage = None
         self.update_image()
 
-    def apply_transformations(self, img):
-        """Применяет масштаб и поворот к изображению"""
-        if self.scale != 1.0:
-            new_width = int(img.width * self.scale)
-            new_height = int(img.height * self.scale)
-            img = img.resize((new_width, new_height), Image.LANCZOS)
-        if self.rotation != 0:
-            img = img.rotate(self.rotation, expand=True)
-        return img
-
     def update_image(self):
         """Обновляет изображение после изменения трансформаций"""
+        cache = get_layer_cache()
         if self.is_gif:
             try:
-                with Image.open(self.image_path) as gif:
-                    self.gif_frames = []
-                    self.frame_durations = []
-                    
-                    for frame in range(gif.n_frames):
-                        gif.seek(frame)
-                        frame_img = gif.copy().convert("RGBA")
-                        frame_img = self.apply_transformations(frame_img)
-                        self.gif_frames.append(frame_img)
-                        
-                        try:
-                            duration = gif.info.get('duration', 100) / 1000.0
-                            self.frame_durations.append(duration)
-                        except:
-                            self.frame_durations.append(0.1)
+                self.gif_frames, self.frame_durations = cache.load(
+                    self.image_path, self.scale, self.rotation, True)
             except Exception as e:
                 print(f"Ошибка загрузки GIF: {e}")
                 self.is_gif = False
-                img = Image.open(self.image_path).convert("RGBA")
-                self.image = self.apply_transformations(img)
+                self.image = cache.load(self.image_path, self.scale, self.rotation)[0][0]
         else:
-            img = Image.open(self.image_path).convert("RGBA")
-            self.image = self.apply_transformations(img)
+            self.image = cache.load(self.image_path, self.scale, self.rotation)[0][0]
         
         self.tkimage = ImageTk.PhotoImage(self.get_current_image())
 
     def get_current_image(self):
         """Возвращает текущий кадр (для GIF) или изображение"""
         if self.is_gif and self.gif_frames:
-            now = time.time()
+            now = self.clock.time()
             if now - self.last_frame_time > self.frame_durations[self.current_frame]:
                 self.current_frame = (self.current_frame + 1) % len(self.gif_frames)
                 self.last_frame_time = now
@@ -97,7 +77,8 @@ class CanvasItem:
         return self.image
 
 class ModelEditor(tk.Toplevel):
-    def __init__(self, master, on_save=None, device='По умолчанию', noise_gate_enabled=True, sensitivity=1.0, thresholds=None):
+    def __init__(self, master, on_save=None, device='По умолчанию', noise_gate_enabled=True, sensitivity=1.0, thresholds=None,
+                 compositor="pillow", clock=None):
         super().__init__(master)
         self.title("Редактор моделей")
         self.geometry("1200x750")
@@ -114,6 +95,9 @@ class ModelEditor(tk.Toplevel):
             'normal': 0.6,
             'shout': 0.8
         }
+        self.compositor = create_compositor(compositor)
+        # Часы превью: кадры GIF, симуляция звука и автосохранение
+        self.clock = clock or RealClock()
 
         # Данные модели
         self.model = {"name": "Без названия", "layers": [], "groups": []}
@@ -124,7 +108,7 @@ class ModelEditor(tk.Toplevel):
         self.selected_group = None
         self.current_selection = []
         self.preview_fps = 24
-        self.last_autosave = time.time()
+        self.last_autosave = self.clock.time()
         self.autosave_interval = 5.0
         self.audio_level = 0.0
         self.blink_preview_running = False
@@ -174,7 +158,8 @@ class ModelEditor(tk.Toplevel):
         # Аудиопроцессор
         self.audio_processor = AudioProcessor(
             callback=self.on_audio_level,
-            device=self.mic_device
+            device=self.mic_device,
+            clock=self.clock
         )
         self.audio_processor.noise_gate_threshold = 0.01 if self.mic_noise_gate_enabled else 0.0
 
@@ -392,7 +377,8 @@ class ModelEditor(tk.Toplevel):
                 self.audio_processor.stop()
                 self.audio_processor = AudioProcessor(
                     callback=self.on_audio_level,
-                    device=self.mic_device
+                    device=self.mic_device,
+                    clock=self.clock
                 )
                 self.audio_processor.noise_gate_threshold = 0.01 if self.mic_noise_gate_enabled else 0.0
                 self.audio_processor.start()
@@ -477,7 +463,7 @@ class ModelEditor(tk.Toplevel):
                     img.seek(0)
                     preview_img = img.copy().convert("RGBA")
                 
-                ci = CanvasItem(layer, fp)
+                ci = CanvasItem(layer, fp, self.clock)
                 self.items.append(ci)
             except Exception as e:
                 print("Ошибка загрузки изображения", e)
@@ -539,7 +525,7 @@ class ModelEditor(tk.Toplevel):
         
         if self.on_save:
             self.on_save(self.model, self.model_dir)
-        self.last_autosave = time.time()
+        self.last_autosave = self.clock.time()
     
     def show_save_slot_dialog(self):
         """Диалог сохранения в слот"""
@@ -610,7 +596,7 @@ class ModelEditor(tk.Toplevel):
         if not self.model_dir:
             return
             
-        base = Image.new("RGBA", (self.canvas_w, self.canvas_h), (0, 0, 0, 0))
+        draws = []
         center_x = self.canvas_w // 2
         center_y = self.canvas_h // 2
         for ci in self.items:
@@ -624,11 +610,9 @@ class ModelEditor(tk.Toplevel):
                 
             px = center_x - img.size[0] // 2 + int(ci.x)
             py = center_y - img.size[1] // 2 + int(ci.y)
-            try:
-                base.alpha_composite(img, (px, py))
-            except Exception:
-                pass
+            draws.append((ci.layer.get("name"), img, px, py, img.size))
                 
+        base = self.compositor.to_image(self.compositor.compose(draws, self.canvas_w, self.canvas_h))
         base.thumbnail((200, 200))
         preview_path = os.path.join(self.model_dir, "preview.png")
         base.save(preview_path)
@@ -682,7 +666,7 @@ class ModelEditor(tk.Toplevel):
                 }
                 self.model.setdefault("layers", []).append(layer)
                 image_path = os.path.join(self.model_dir, base)
-                ci = CanvasItem(layer, image_path)
+                ci = CanvasItem(layer, image_path, self.clock)
                 self.items.append(ci)
             except Exception as e:
                 print("Ошибка импорта", e)
@@ -690,7 +674,7 @@ class ModelEditor(tk.Toplevel):
         self.refresh_import_list()
         self.refresh_items_list()
         self.redraw_canvas()
-        self.last_autosave = time.time()
+        self.last_autosave = self.clock.time()
 
     # ------------- Обновление UI -------------
     def refresh_import_list(self):
@@ -746,7 +730,7 @@ class ModelEditor(tk.Toplevel):
             self.items_listbox.insert("end", label)
 
     def redraw_canvas(self, level=0.0, mode="none"):
-        base = Image.new("RGBA", (self.canvas_w, self.canvas_h), (0, 0, 0, 0))
+        draws = []
         center_x = self.canvas_w // 2
         center_y = self.canvas_h // 2
         
@@ -760,10 +744,7 @@ class ModelEditor(tk.Toplevel):
                     
                 px = center_x - img.size[0] // 2 + int(ci.x)
                 py = center_y - img.size[1] // 2 + int(ci.y)
-                try:
-                    base.alpha_composite(img, (px, py))
-                except Exception:
-                    pass
+                draws.append((ci.layer.get("name"), img, px, py, img.size))
         else:
             # Определение текущего состояния
             current_state = "silent"
@@ -800,11 +781,9 @@ class ModelEditor(tk.Toplevel):
                     
                 px = center_x - img.size[0] // 2 + int(ci.x)
                 py = center_y - img.size[1] // 2 + int(ci.y)
-                try:
-                    base.alpha_composite(img, (px, py))
-                except Exception:
-                    pass
+                draws.append((ci.layer.get("name"), img, px, py, img.size))
         
+        base = self.compositor.to_image(self.compositor.compose(draws, self.canvas_w, self.canvas_h))
         self.base_tk = ImageTk.PhotoImage(base)
         self.canvas.delete("all")
         self.canvas.create_image(0, 0, anchor="nw", image=self.base_tk)
@@ -849,7 +828,7 @@ class ModelEditor(tk.Toplevel):
                     }
                     self.model.setdefault("layers", []).append(layer)
                 image_path = os.path.join(self.model_dir, fname)
-                ci = CanvasItem(layer, image_path)
+                ci = CanvasItem(layer, image_path, self.clock)
                 self.items.append(ci)
                 self.refresh_items_list()
                 self.redraw_canvas()
@@ -1012,7 +991,7 @@ class ModelEditor(tk.Toplevel):
         
         self.refresh_items_list()
         self.redraw_canvas()
-        self.last_autosave = time.time()
+        self.last_autosave = self.clock.time()
 
     # ------------- Управление порядком -------------
     def bring_forward(self):
@@ -1172,7 +1151,7 @@ class ModelEditor(tk.Toplevel):
 
     def on_canvas_mouse_up(self, event):
         self.drag_data["item"] = None
-        self.last_autosave = time.time()
+        self.last_autosave = self.clock.time()
 
     # ------------- Логика групп -------------
     def apply_group_logic(self):
@@ -1310,7 +1289,7 @@ class ModelEditor(tk.Toplevel):
     # ------------- Цикл превью -------------
     def _preview_loop(self):
         try:
-            now = time.time()
+            now = self.clock.time()
             if now - self.last_autosave > self.autosave_interval:
                 try:
                     if self.model_dir:
@@ -1337,7 +1316,7 @@ class ModelEditor(tk.Toplevel):
             if mode == "microphone":
                 level = self.audio_level
             elif mode == "simulate":
-                t = time.time()
+                t = self.clock.time()
                 level = (math.sin(t * 2) + 1) / 2
                 level = level * self.mic_sensitivity
                 self.level_bar["value"] = level * 100
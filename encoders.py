@@ -0,0 +1,228 @@
+import io, time, struct
+import numpy as np
+from PIL import Image
+
+class FrameEncoder:
+    """Базовый кодировщик кадров.
+
+    Наследники реализуют _encode. Время кодирования и размер кадра
+    сохраняются, чтобы можно было сравнить форматы по CPU и трафику.
+    """
+    name = ""
+    mimetype = "application/octet-stream"
+
+    def __init__(self):
+        self.last_encode_time = 0.0
+        self.last_size = 0
+        self.frames = 0
+        self.total_encode_time = 0.0
+        self.total_bytes = 0
+
+    def encode(self, img):
+        """Кодирование кадра с замером времени"""
+        start = time.perf_counter()
+        data = self._encode(img)
+        elapsed = time.perf_counter() - start
+        self.last_encode_time = elapsed
+        self.last_size = len(data)
+        self.frames += 1
+        self.total_encode_time += elapsed
+        self.total_bytes += len(data)
+        return data
+
+    def encode_region(self, img, rect):
+        """Кодирование области кадра для частичного обновления (без статистики)"""
+        return self._encode(img.crop(rect))
+
+    def _encode(self, img):
+        raise NotImplementedError
+
+    def stats(self):
+        """Статистика кодирования"""
+        frames = self.frames or 1
+        return {
+            'format': self.name,
+            'frames': self.frames,
+            'last_encode_ms': self.last_encode_time * 1000,
+            'last_size': self.last_size,
+            'avg_encode_ms': self.total_encode_time / frames * 1000,
+            'avg_size': self.total_bytes / frames,
+        }
+
+class PngEncoder(FrameEncoder):
+    name = "png"
+    mimetype = "image/png"
+
+    def __init__(self, compress_level=6):
+        super().__init__()
+        self.compress_level = max(0, min(9, int(compress_level)))
+
+    def _encode(self, img):
+        with io.BytesIO() as buf:
+            img.save(buf, format="PNG", compress_level=self.compress_level)
+            return buf.getvalue()
+
+class WebpEncoder(FrameEncoder):
+    name = "webp"
+    mimetype = "image/webp"
+
+    def __init__(self, lossless=True, quality=80, method=0):
+        super().__init__()
+        self.lossless = bool(lossless)
+        self.quality = int(quality)
+        self.method = int(method)
+
+    def _encode(self, img):
+        with io.BytesIO() as buf:
+            img.save(buf, format="WEBP", lossless=self.lossless,
+                     quality=self.quality, method=self.method)
+            return buf.getvalue()
+
+class JpegEncoder(FrameEncoder):
+    """JPEG без альфа-канала: кадр накладывается на однотонную подложку
+    (матте), которую можно убрать хромакеем в OBS"""
+    name = "jpeg"
+    mimetype = "image/jpeg"
+
+    def __init__(self, quality=85, matte=(0, 255, 0)):
+        super().__init__()
+        self.quality = int(quality)
+        self.matte = tuple(int(c) for c in matte)[:3]
+        self._background = None
+
+    def _encode(self, img):
+        if self._background is None or self._background.size != img.size:
+            self._background = Image.new("RGB", img.size, self.matte)
+        flat = self._background.copy()
+        flat.paste(img, (0, 0), img)
+        with io.BytesIO() as buf:
+            flat.save(buf, format="JPEG", quality=self.quality)
+            return buf.getvalue()
+
+QOI_END = b"\x00" * 7 + b"\x01"
+QOI_MAX_RUN = 62
+
+def qoi_encode(img):
+    """Кодирование RGBA-кадра в QOI векторно, без цикла по пикселям.
+
+    Каждый пиксель кодируется относительно предыдущего операциями RUN,
+    DIFF, LUMA, RGB и RGBA. Операция INDEX требует таблицы уже
+    встреченных цветов, то есть последовательного прохода, и не
+    используется. Формат от этого не меняется, любой декодер QOI
+    читает результат, только файл чуть больше.
+    """
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    px = np.ascontiguousarray(np.asarray(img, dtype=np.uint8)).reshape(-1, 4)
+    n = len(px)
+    words = px.view(np.uint32).ravel()
+    start = np.array([0, 0, 0, 255], dtype=np.uint8).view(np.uint32)[0]
+
+    # Разности считаются только для пикселей, отличных от предыдущего;
+    # в кадрах PNG-тюбера большую часть холста занимают серии прозрачных
+    changed = np.flatnonzero(words[1:] != words[:-1]) + 1
+    if words[0] != start:
+        changed = np.concatenate(([0], changed))
+    cur = px[changed]
+    prev = px[changed - 1]
+    if len(changed) and changed[0] == 0:
+        prev[0] = (0, 0, 0, 255)
+    # Разности по модулю 256, как в спецификации
+    diff = (cur - prev).view(np.int8).astype(np.int16)
+    dr, dg, db = diff[:, 0], diff[:, 1], diff[:, 2]
+    dr_dg, db_dg = dr - dg, db - dg
+    alpha_same = diff[:, 3] == 0
+    small = (alpha_same & (dr >= -2) & (dr <= 1) & (dg >= -2) & (dg <= 1)
+             & (db >= -2) & (db <= 1))
+    luma = (alpha_same & ~small & (dg >= -32) & (dg <= 31)
+            & (dr_dg >= -8) & (dr_dg <= 7) & (db_dg >= -8) & (db_dg <= 7))
+    rgb = alpha_same & ~small & ~luma
+    rgba = ~alpha_same
+
+    # Серии одинаковых пикселей лежат между соседними измененными
+    bounds = np.concatenate(([-1], changed, [n]))
+    gaps = np.diff(bounds) - 1
+    has_run = gaps > 0
+    run_starts = bounds[:-1][has_run] + 1
+    run_lengths = gaps[has_run]
+    run_ops = (run_lengths + QOI_MAX_RUN - 1) // QOI_MAX_RUN
+
+    # Смещения операций в потоке: события (измененные пиксели и серии)
+    # упорядочиваются по позиции, размеры суммируются нарастающим итогом
+    positions = np.concatenate((changed, run_starts))
+    sizes = np.concatenate((np.select([small, luma, rgb], [1, 2, 4], 5), run_ops))
+    order = np.argsort(positions, kind="stable")
+    ordered_sizes = sizes[order]
+    ends = np.cumsum(ordered_sizes)
+    offsets = np.empty_like(ends)
+    offsets[order] = ends - ordered_sizes
+    body = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    changed_at = offsets[:len(changed)]
+    run_at = offsets[len(changed):]
+
+    at = changed_at[small]
+    body[at] = 0x40 | ((dr[small] + 2) << 4) | ((dg[small] + 2) << 2) | (db[small] + 2)
+    at = changed_at[luma]
+    body[at] = 0x80 | (dg[luma] + 32)
+    body[at + 1] = ((dr_dg[luma] + 8) << 4) | (db_dg[luma] + 8)
+    for mask, tag, channels in ((rgb, 0xFE, 3), (rgba, 0xFF, 4)):
+        at = changed_at[mask]
+        body[at] = tag
+        for c in range(channels):
+            body[at + 1 + c] = cur[mask, c]
+    # Все операции серии, кроме последней, - RUN максимальной длины
+    if len(run_starts):
+        if (run_ops > 1).any():
+            total = int(run_ops.sum())
+            first = np.cumsum(run_ops) - run_ops
+            at = np.repeat(run_at, run_ops) + np.arange(total) - np.repeat(first, run_ops)
+            body[at] = 0xC0 | (QOI_MAX_RUN - 1)
+        body[run_at + run_ops - 1] = 0xC0 | ((run_lengths - 1) % QOI_MAX_RUN)
+
+    header = b"qoif" + struct.pack(">II", img.width, img.height) + bytes((4, 0))
+    return header + body.tobytes() + QOI_END
+
+class QoiEncoder(FrameEncoder):
+    """QOI - формат без потерь с простым кодированием (векторный кодировщик на NumPy)"""
+    name = "qoi"
+    mimetype = "image/qoi"
+
+    def _encode(self, img):
+        return qoi_encode(img)
+
+class RawEncoder(FrameEncoder):
+    """Несжатые RGBA-байты, размер кадра передается в параметрах типа"""
+    name = "raw"
+
+    def __init__(self):
+        super().__init__()
+        self.mimetype = "application/x-rgba"
+
+    def _encode(self, img):
+        self.mimetype = f"application/x-rgba; width={img.width}; height={img.height}"
+        return img.tobytes()
+
+ENCODERS = {
+    "png": PngEncoder,
+    "webp": WebpEncoder,
+    "jpeg": JpegEncoder,
+    "qoi": QoiEncoder,
+    "raw": RawEncoder,
+}
+
+def create_encoder(config=None):
+    """Создание кодировщика по настройкам вида {"format": "png", ...}.
+
+    При неизвестном формате или ошибке параметров используется PNG.
+    """
+    config = dict(config or {})
+    fmt = str(config.pop("format", "png")).lower()
+    encoder_cls = ENCODERS.get(fmt)
+    if encoder_cls is None:
+        print(f"Неизвестный формат кадров: {fmt}, используется PNG")
+        return PngEncoder()
+    try:
+        return encoder_cls(**config)
+    except Exception as e:
+        print(f"Ошибка создания кодировщика {fmt}: {e}, используется PNG")
+        return PngEncoder()
@@ -0,0 +1,321 @@
+import os, sys, json, math, signal, argparse, threading
+from flask import jsonify, request, Response
+from renderer import Renderer
+from webserver import WebServer
+from audio import AudioProcessor
+from encoders import create_encoder
+from compositor import create_compositor
+from clock import create_clock
+from layer_cache import get_layer_cache
+from render_plan import STATE_ORDER
+
+# Определение базовой директории
+if getattr(sys, 'frozen', False):
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MODELS_DIR = os.path.join(BASE_DIR, "models")
+SETTINGS_FILE = os.path.join(BASE_DIR, "settings.json")
+
+# Ключи settings.json, которые можно менять через POST /control/settings
+CONTROL_KEYS = ("effects", "thresholds", "active_states", "sensitivity", "noise_gate_enabled",
+                "idle_enabled", "idle_timeout", "idle_fade", "mic_device")
+EFFECTS = ("shake", "bounce", "pulse", "blink", "random_effect")
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def _number(key, value):
+    if isinstance(value, bool):
+        raise ValueError(f"{key}: ожидается число")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{key}: ожидается число")
+    if not math.isfinite(number) or number < 0:
+        raise ValueError(f"{key}: ожидается неотрицательное число")
+    return number
+
+def _flag(key, value):
+    if not isinstance(value, bool):
+        raise ValueError(f"{key}: ожидается true или false")
+    return value
+
+def _mapping(key, value, current, names, convert):
+    """Словарь с ключами из names: новые значения поверх текущих"""
+    if not isinstance(value, dict):
+        raise ValueError(f"{key}: ожидается JSON-объект")
+    unknown = [name for name in value if name not in names]
+    if unknown:
+        raise ValueError(f"{key}: неизвестные ключи {', '.join(unknown)}")
+    merged = dict(current or {})
+    for name, item in value.items():
+        merged[name] = convert(f"{key}.{name}", item)
+    return merged
+
+def parse_settings(changes, current):
+    """Проверка и приведение изменений настроек из POST /control/settings.
+
+    current - словари, действующие сейчас (effects, thresholds,
+    active_states), изменения накладываются на них. При ошибке -
+    ValueError с описанием ключа.
+    """
+    if not isinstance(changes, dict):
+        raise ValueError("Ожидается JSON-объект")
+    unknown = [key for key in changes if key not in CONTROL_KEYS]
+    if unknown:
+        raise ValueError(f"Неизвестные ключи: {', '.join(unknown)}")
+    parsed = {}
+    for key, value in changes.items():
+        if key == 'effects':
+            parsed[key] = _mapping(key, value, current.get(key), EFFECTS, _flag)
+        elif key == 'active_states':
+            parsed[key] = _mapping(key, value, current.get(key), STATE_ORDER, _flag)
+        elif key == 'thresholds':
+            thresholds = _mapping(key, value, current.get(key), STATE_ORDER, _number)
+            missing = [state for state in STATE_ORDER if state not in thresholds]
+            if missing:
+                raise ValueError(f"thresholds: нет порогов {', '.join(missing)}")
+            parsed[key] = thresholds
+        elif key in ('sensitivity', 'idle_timeout', 'idle_fade'):
+            parsed[key] = _number(key, value)
+        elif key in ('noise_gate_enabled', 'idle_enabled'):
+            parsed[key] = _flag(key, value)
+        elif key == 'mic_device':
+            if value is not None and not isinstance(value, str):
+                raise ValueError("mic_device: ожидается строка")
+            parsed[key] = value
+    return parsed
+
+class HeadlessApp:
+    """Режим сервиса без Tkinter: рендерер, звук и веб-сервер.
+
+    Настройки берутся из settings.json, как в окне приложения, а
+    управление идет по HTTP через /control/*. Если задан token, запросы
+    управления должны передавать его в заголовке X-Control-Token или в
+    параметре ?token=.
+    """
+    def __init__(self, settings, settings_file=SETTINGS_FILE, host="0.0.0.0", port=6969,
+                 audio_enabled=True, token=None):
+        self.settings = settings
+        self.settings_file = settings_file
+        self.token = token
+        self.slot = None
+        self.audio_enabled = audio_enabled
+        self.audio_level_scaled = 0.0
+        self._stop = threading.Event()
+
+        self.clock = create_clock(settings.get('clock', 'monotonic'))
+        self.renderer = Renderer(width=700, height=700, fps=60, clock=self.clock)
+        self.renderer.set_scene_cache(settings.get('scene_cache_mb', 64),
+                                      settings.get('scene_cache_warmup', False))
+        self.renderer.set_encoder(create_encoder(settings.get('encoder')))
+        self.renderer.set_compositor(create_compositor(settings.get('compositor', 'pillow')))
+        self.renderer.scheduler.set_skip_policy(settings.get('frame_skip_policy', 'skip'))
+        self.renderer.set_adaptive(settings.get('adaptive_fps', False))
+        pulse = settings.get('pulse', {})
+        self.renderer.set_pulse(pulse.get('steps', 33), pulse.get('resample', 'LANCZOS'),
+                                pulse.get('cache_mb', 64))
+        get_layer_cache().set_limit(settings.get('layer_cache_mb', 256))
+        self.apply_settings(settings)
+        self.renderer.set_noise_gate(self.noise_gate())
+        self.renderer.set_idle(settings.get('idle_enabled', False), settings.get('idle_timeout', 60.0),
+                               settings.get('idle_fade', 1.0))
+
+        self.audio = self.create_audio(settings.get('mic_device')) if audio_enabled else None
+        self.webserver = WebServer(self.renderer, host=host, port=port, audio=self.audio)
+        self.register_routes(self.webserver.app)
+
+    def create_audio(self, device):
+        """Аудиопроцессор с режимом расчета уровня из настроек"""
+        audio = AudioProcessor(callback=self.on_audio_level, device=device,
+                               level_mode=self.settings.get('audio_level_mode', 'thread'),
+                               clock=self.clock)
+        audio.noise_gate_threshold = self.noise_gate()
+        return audio
+
+    def noise_gate(self):
+        return 0.01 if self.settings.get('noise_gate_enabled', True) else 0.0
+
+    def apply_settings(self, changes):
+        """Применение ключей настроек к рендереру и звуку"""
+        settings = self.settings
+        settings.update(changes)
+        renderer = self.renderer
+        if 'effects' in changes:
+            renderer.set_effects(settings['effects'])
+        if 'thresholds' in changes:
+            renderer.set_thresholds(settings['thresholds'])
+        if 'active_states' in changes:
+            renderer.set_active_states(settings['active_states'])
+        if 'noise_gate_enabled' in changes:
+            renderer.set_noise_gate(self.noise_gate())
+            audio = getattr(self, 'audio', None)
+            if audio is not None:
+                audio.noise_gate_threshold = self.noise_gate()
+        if any(key in changes for key in ('idle_enabled', 'idle_timeout', 'idle_fade')):
+            renderer.set_idle(settings.get('idle_enabled', False), settings.get('idle_timeout', 60.0),
+                              settings.get('idle_fade', 1.0))
+        if 'mic_device' in changes and getattr(self, 'audio', None) is not None:
+            self.restart_audio()
+
+    def restart_audio(self):
+        """Перезапуск захвата звука с устройством из настроек"""
+        self.audio.stop()
+        self.audio = self.create_audio(self.settings.get('mic_device'))
+        self.audio.start()
+        self.webserver.set_audio(self.audio)
+
+    def on_audio_level(self, level):
+        """Уровень звука с учетом чувствительности"""
+        try:
+            self.audio_level_scaled = level * float(self.settings.get('sensitivity', 1.0))
+        except (TypeError, ValueError):
+            self.audio_level_scaled = level
+        self.renderer.set_audio_level(self.audio_level_scaled,
+                                      getattr(self.audio, 'last_capture_time', None))
+
+    def load_slot(self, idx):
+        """Загрузка модели из слота (нумерация с 1); False, если модели нет"""
+        slot_dir = os.path.join(MODELS_DIR, f"slot{idx}")
+        json_path = os.path.join(slot_dir, "model.json")
+        if not os.path.exists(json_path):
+            print(f"В слоте {idx} нет модели")
+            return False
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.renderer.load_model(data, slot_dir)
+        self.slot = idx
+        return True
+
+    def save_settings(self):
+        """Сохранение настроек; ключи без управления сохраняются как были"""
+        settings = {}
+        if os.path.exists(self.settings_file):
+            with open(self.settings_file, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+        settings.update({key: self.settings[key] for key in CONTROL_KEYS if key in self.settings})
+        with open(self.settings_file, "w", encoding="utf-8") as f:
+            json.dump(settings, f, indent=2)
+
+    def status(self):
+        return {
+            'slot': self.slot,
+            'model_version': self.renderer.model_version,
+            'audio': self.audio is not None and self.audio.running,
+            'level': self.audio_level_scaled,
+            'settings': {key: self.settings.get(key) for key in CONTROL_KEYS},
+        }
+
+    def register_routes(self, app):
+        """Маршруты управления /control/*"""
+        def authorized():
+            if not self.token:
+                return True
+            return (request.headers.get("X-Control-Token") == self.token
+                    or request.args.get("token") == self.token)
+
+        @app.before_request
+        def check_token():
+            if request.path.startswith("/control/") and not authorized():
+                return Response("Нужен токен управления", status=403)
+
+        @app.route("/control/status")
+        def control_status():
+            return jsonify(self.status())
+
+        @app.route("/control/slot/<int:idx>", methods=["POST"])
+        def control_slot(idx):
+            if not self.load_slot(idx):
+                return Response(f"В слоте {idx} нет модели", status=404)
+            return jsonify(self.status())
+
+        @app.route("/control/settings", methods=["POST"])
+        def control_settings():
+            # Тело - часть settings.json, например {"effects": {"shake": true}};
+            # словари накладываются на текущие значения, ?save=1 сохраняет файл
+            renderer = self.renderer
+            current = {'effects': renderer.effects, 'thresholds': renderer.thresholds,
+                       'active_states': renderer.active_states}
+            try:
+                changes = parse_settings(request.get_json(silent=True), current)
+            except ValueError as e:
+                return Response(str(e), status=400)
+            self.apply_settings(changes)
+            if request.args.get("save") == "1":
+                try:
+                    self.save_settings()
+                except Exception as e:
+                    return Response(f"Не удалось сохранить настройки: {e}", status=500)
+            return jsonify(self.status())
+
+        @app.route("/control/level", methods=["POST"])
+        def control_level():
+            # Внешний источник уровня, когда захват звука выключен (--no-audio)
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return Response("Ожидается JSON-объект", status=400)
+            try:
+                level = _number("level", data.get("level", 0.0))
+            except ValueError as e:
+                return Response(str(e), status=400)
+            self.on_audio_level(level)
+            return jsonify({'level': self.audio_level_scaled})
+
+    def start(self):
+        if self.audio is not None:
+            self.audio.start()
+        self.renderer.start()
+        self.webserver.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Работа до SIGINT/SIGTERM"""
+        self.start()
+        signal.signal(signal.SIGINT, lambda *args: self.stop())
+        if hasattr(signal, 'SIGTERM'):
+            signal.signal(signal.SIGTERM, lambda *args: self.stop())
+        print(f"WebPNGTuber без окна: http://{self.webserver.host}:{self.webserver.port}/")
+        while not self._stop.wait(1.0):
+            pass
+        if self.audio is not None:
+            self.audio.stop()
+        self.renderer.stop()
+        self.webserver.stop()
+
+def load_settings(path):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Ошибка загрузки настроек: {e}")
+    return {}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WebPNGTuber без окна, с управлением по HTTP")
+    parser.add_argument("--slot", type=int, default=1, help="слот модели (1-6)")
+    parser.add_argument("--settings", default=SETTINGS_FILE, help="файл настроек")
+    parser.add_argument("--host", default=None,
+                        help="адрес сервера (по умолчанию 0.0.0.0 с токеном, 127.0.0.1 без него)")
+    parser.add_argument("--port", type=int, default=6969)
+    parser.add_argument("--no-audio", action="store_true",
+                        help="без захвата звука, уровень задается через POST /control/level")
+    parser.add_argument("--token", default=os.environ.get("WEBPNGTUBER_TOKEN"),
+                        help="токен для /control/* (или переменная WEBPNGTUBER_TOKEN)")
+    args = parser.parse_args(argv)
+    # Без токена /control/* открыт любому, кто достучится до порта
+    if args.host is None:
+        args.host = "0.0.0.0" if args.token else "127.0.0.1"
+    elif not args.token and args.host not in LOCAL_HOSTS:
+        parser.error("без --token управление доступно только на 127.0.0.1")
+
+    app = HeadlessApp(load_settings(args.settings), args.settings, args.host, args.port,
+                      audio_enabled=not args.no_audio, token=args.token)
+    app.load_slot(args.slot)
+    app.run()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import threading, time
+from scheduler import FrameTimeHistogram
+
+class LatencyTracker:
+    """Замер задержки от звука до экрана.
+
+    Событие начинается при смене состояния голоса и проходит этапы:
+    capture - callback PortAudio получил блок, level - уровень дошел до
+    рендерера, scene - рендерер собрал сцену, encode - кадр закодирован,
+    send - байты кадра (или состояние сцены) записаны в сокет клиента.
+    Отслеживается одно событие за раз: новое событие заменяет
+    незавершенное, которое учитывается как неполное.
+    """
+    STAGES = ("capture_to_level", "level_to_scene", "scene_to_encode", "encode_to_send", "total")
+
+    def __init__(self, window=600):
+        self._lock = threading.Lock()
+        self._event = None
+        self.completed = 0
+        self.incomplete = 0
+        self.histograms = {stage: FrameTimeHistogram(window) for stage in self.STAGES}
+
+    def begin(self, captured_at=None):
+        """Новое событие: смена состояния голоса"""
+        now = time.perf_counter()
+        with self._lock:
+            if self._event is not None:
+                self.incomplete += 1
+            self._event = {'capture': captured_at if captured_at is not None else now, 'level': now}
+
+    def scene_built(self, started, scene_seq=None):
+        """Рендерер собрал сцену, начатую в started (perf_counter).
+
+        scene_seq - номер опубликованного состояния сцены или None, если
+        сцена не изменилась. Сцены, начатые до события, не учитываются.
+        """
+        with self._lock:
+            event = self._event
+            if event is not None and 'scene' not in event and started >= event['level']:
+                event['scene'] = time.perf_counter()
+                if scene_seq is not None:
+                    event['scene_seq'] = scene_seq
+
+    def frame_encoded(self, seq):
+        with self._lock:
+            event = self._event
+            if event is not None and 'scene' in event and 'encode' not in event:
+                event['encode'] = time.perf_counter()
+                event['frame_seq'] = seq
+
+    def frame_sent(self, seq):
+        """Кадр seq записан в сокет клиента"""
+        with self._lock:
+            event = self._event
+            if event is not None and seq >= event.get('frame_seq', seq + 1):
+                self._finish(event, event['encode'])
+
+    def state_sent(self, scene_seq):
+        """Состояние сцены scene_seq записано в сокет клиента (без кодирования кадра)"""
+        with self._lock:
+            event = self._event
+            if event is not None and scene_seq >= event.get('scene_seq', scene_seq + 1):
+                self._finish(event, event['scene'])
+
+    def _finish(self, event, encoded):
+        now = time.perf_counter()
+        durations = {
+            'capture_to_level': event['level'] - event['capture'],
+            'level_to_scene': event['scene'] - event['level'],
+            'scene_to_encode': encoded - event['scene'],
+            'encode_to_send': now - encoded,
+            'total': now - event['capture'],
+        }
+        for stage, value in durations.items():
+            self.histograms[stage].add(max(0.0, value))
+        self.completed += 1
+        self._event = None
+
+    def stats(self):
+        """Перцентили задержки по этапам в миллисекундах"""
+        with self._lock:
+            result = {'completed': self.completed, 'incomplete': self.incomplete}
+        for stage in self.STAGES:
+            result[stage + '_ms'] = self.histograms[stage].stats()
+        return result
@@ -0,0 +1,228 @@
+import os, sys, json, hashlib, threading, argparse
+from PIL import Image
+
+# Определение базовой директории
+if getattr(sys, 'frozen', False):
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_DIR = os.path.join(BASE_DIR, "cache", "layers")
+RESAMPLE_FILTERS = {
+    "NEAREST": Image.NEAREST,
+    "BILINEAR": Image.BILINEAR,
+    "BICUBIC": Image.BICUBIC,
+    "LANCZOS": Image.LANCZOS,
+}
+
+def load_layer_frames(fp, scale=1.0, rotation=0, is_gif=False, resample="LANCZOS"):
+    """Загрузка слоя из исходного файла с масштабом и поворотом.
+
+    Возвращает (кадры, длительности кадров в секундах). Для обычных
+    изображений - один кадр и пустой список длительностей.
+    """
+    def transform(img):
+        if scale != 1.0:
+            new_width = int(img.width * scale)
+            new_height = int(img.height * scale)
+            img = img.resize((new_width, new_height), RESAMPLE_FILTERS[resample])
+        if rotation != 0:
+            img = img.rotate(rotation, expand=True)
+        return img
+
+    if not is_gif:
+        return [transform(Image.open(fp).convert("RGBA"))], []
+
+    frames = []
+    durations = []
+    img = Image.open(fp)
+    for frame in range(img.n_frames):
+        img.seek(frame)
+        frames.append(transform(img.copy().convert("RGBA")))
+        try:
+            durations.append(img.info.get('duration', 100) / 1000.0)
+        except:
+            durations.append(0.1)
+    return frames, durations
+
+class LayerCache:
+    """Дисковый кэш трансформированных слоев.
+
+    Ключ - хэш содержимого исходного файла вместе с масштабом, поворотом и
+    фильтром ресэмплинга, поэтому кэш общий для всех слотов и редактора.
+    Каждая запись - PNG с кадрами, сложенными по вертикали, и JSON с
+    размерами и длительностями кадров. При превышении лимита удаляются
+    записи, которые дольше всего не использовались.
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_mb=256):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._hashes = {}  # (путь, mtime, размер) -> хэш содержимого
+        self._total = None
+
+    def set_limit(self, max_mb):
+        """Установка лимита размера кэша"""
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+
+    def _content_hash(self, fp):
+        st = os.stat(fp)
+        stamp = (os.path.abspath(fp), st.st_mtime_ns, st.st_size)
+        digest = self._hashes.get(stamp)
+        if digest is None:
+            h = hashlib.sha1()
+            with open(fp, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            self._hashes[stamp] = digest
+        return digest
+
+    def key(self, fp, scale=1.0, rotation=0, is_gif=False, resample="LANCZOS"):
+        """Ключ записи кэша"""
+        params = f"{self._content_hash(fp)}|{float(scale)}|{int(rotation)}|{bool(is_gif)}|{resample}"
+        return hashlib.sha1(params.encode()).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".png", base + ".json"
+
+    def load(self, fp, scale=1.0, rotation=0, is_gif=False, resample="LANCZOS"):
+        """Трансформированные кадры слоя: из кэша или из исходного файла"""
+        key = self.key(fp, scale, rotation, is_gif, resample)
+        png_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            strip = Image.open(png_path).convert("RGBA")
+            frames = []
+            y = 0
+            for w, h in meta["sizes"]:
+                frames.append(strip.crop((0, y, w, y + h)))
+                y += h
+            # Время изменения файлов служит временем последнего использования
+            os.utime(png_path)
+            os.utime(meta_path)
+            self.hits += 1
+            return frames, meta.get("durations", [])
+        except Exception:
+            pass
+
+        self.misses += 1
+        frames, durations = load_layer_frames(fp, scale, rotation, is_gif, resample)
+        try:
+            self._store(png_path, meta_path, frames, durations)
+        except Exception as e:
+            print(f"Ошибка записи кэша слоев: {e}")
+        return frames, durations
+
+    def _store(self, png_path, meta_path, frames, durations):
+        width = max(f.width for f in frames)
+        height = sum(f.height for f in frames)
+        strip = Image.new("RGBA", (max(1, width), max(1, height)), (0, 0, 0, 0))
+        y = 0
+        for f in frames:
+            strip.paste(f, (0, y))
+            y += f.height
+        os.makedirs(os.path.dirname(png_path), exist_ok=True)
+        strip.save(png_path, compress_level=1)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"sizes": [list(f.size) for f in frames], "durations": durations}, f)
+        added = os.path.getsize(png_path) + os.path.getsize(meta_path)
+        with self._lock:
+            if self._total is None:
+                self._total = self._scan_size()
+            else:
+                self._total += added
+            over = self._total > self.max_bytes
+        if over:
+            self.prune()
+
+    def _entries(self):
+        """Записи кэша: [(время использования, размер, [файлы])]"""
+        entries = {}
+        if not os.path.isdir(self.cache_dir):
+            return []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                key = os.path.splitext(path)[0]
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                used, size, paths = entries.get(key, (0, 0, []))
+                entries[key] = (max(used, st.st_mtime), size + st.st_size, paths + [path])
+        return list(entries.values())
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def prune(self, max_mb=None):
+        """Удаление давно не использованных записей до лимита размера.
+
+        Возвращает (число удаленных записей, оставшийся размер в байтах).
+        """
+        limit = self.max_bytes if max_mb is None else int(max_mb * 1024 * 1024)
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, paths in entries:
+                if total <= limit:
+                    break
+                for path in paths:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                total -= size
+                removed += 1
+            self._total = total
+            return removed, total
+
+    def stats(self):
+        """Статистика кэша"""
+        entries = self._entries()
+        return {
+            'entries': len(entries),
+            'size_mb': sum(size for _, size, _ in entries) / (1024 * 1024),
+            'max_mb': self.max_bytes / (1024 * 1024),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+_default_cache = None
+
+def get_layer_cache():
+    """Общий кэш слоев для рендерера и редактора"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = LayerCache()
+    return _default_cache
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Управление кэшем трансформированных слоев")
+    parser.add_argument("--dir", default=CACHE_DIR, help="папка кэша")
+    sub = parser.add_subparsers(dest="command", required=True)
+    prune = sub.add_parser("prune", help="удалить давно не использованные записи")
+    prune.add_argument("--max-mb", type=float, default=256, help="допустимый размер кэша в МБ")
+    sub.add_parser("clear", help="удалить все записи")
+    sub.add_parser("stats", help="показать размер кэша")
+    args = parser.parse_args(argv)
+
+    cache = LayerCache(args.dir)
+    if args.command == "prune":
+        removed, total = cache.prune(args.max_mb)
+        print(f"Удалено записей: {removed}, размер кэша: {total / (1024 * 1024):.1f} МБ")
+    elif args.command == "clear":
+        removed, _ = cache.prune(0)
+        print(f"Удалено записей: {removed}")
+    else:
+        stats = cache.stats()
+        print(f"Записей: {stats['entries']}, размер: {stats['size_mb']:.1f} МБ")
+
+if __name__ == "__main__":
+    main()
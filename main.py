@@ -5,6 +5,10 @@ from editor import ModelEditor
 from renderer import Renderer
 from webserver import WebServer
 from audio import AudioProcessor
+from encoders import create_encoder
+from compositor import create_compositor
+from clock import create_clock
+from layer_cache import get_layer_cache
 import os
 import json
 from PIL import Image, ImageTk
@@ -31,9 +35,10 @@ class App:
         self.settings = self.load_settings()
 
         # Инициализация компонентов
-        self.renderer = Renderer(width=700, height=700, fps=60)
-        self.audio = AudioProcessor(callback=self.on_audio_level,
-                                   device=self.settings.get('mic_device'))
+        # Общие часы анимации рендерера, аудио и редактора
+        self.clock = create_clock(self.settings.get('clock', 'monotonic'))
+        self.renderer = Renderer(width=700, height=700, fps=60, clock=self.clock)
+        self.audio = self.create_audio(self.settings.get('mic_device'))
         self.audio.noise_gate_threshold = 0.01
         self.webserver = None
 
@@ -53,6 +58,16 @@ class App:
             'blink': True
         })
         self.renderer.set_effects(self.effects)
+        self.renderer.set_scene_cache(self.settings.get('scene_cache_mb', 64),
+                                      self.settings.get('scene_cache_warmup', False))
+        self.renderer.set_encoder(create_encoder(self.settings.get('encoder')))
+        self.renderer.set_compositor(create_compositor(self.settings.get('compositor', 'pillow')))
+        self.renderer.scheduler.set_skip_policy(self.settings.get('frame_skip_policy', 'skip'))
+        self.renderer.set_adaptive(self.settings.get('adaptive_fps', False))
+        pulse = self.settings.get('pulse', {})
+        self.renderer.set_pulse(pulse.get('steps', 33), pulse.get('resample', 'LANCZOS'),
+                                pulse.get('cache_mb', 64))
+        get_layer_cache().set_limit(self.settings.get('layer_cache_mb', 256))
 
         # UI layout
         frame = ttk.Frame(root, padding=8)
@@ -119,8 +134,11 @@ class App:
         self.vol_label.pack(anchor="w")
 
         self.sensitivity = tk.DoubleVar(value=self.settings.get('sensitivity', 1.0))
+        # Копия для потока звука: DoubleVar.get() из другого потока ждет главный цикл Tk
+        self.sensitivity_value = self.sensitivity.get()
         ttk.Label(mic_frame, text="Чувствительность").pack(anchor="w")
-        ttk.Scale(mic_frame, from_=0.1, to=5.0, variable=self.sensitivity, orient="horizontal").pack(fill="x")
+        ttk.Scale(mic_frame, from_=0.1, to=5.0, variable=self.sensitivity, orient="horizontal",
+                  command=self.update_sensitivity).pack(fill="x")
 
         # Подавление шума
         self.noise_gate_enabled = tk.BooleanVar(value=self.settings.get('noise_gate_enabled', True))
@@ -226,12 +244,15 @@ class App:
         # Запуск обработки аудио
         self.audio.start()
         self.toggle_noise_gate()
+        if self.audio.level_mode == "callback":
+            self.poll_level_ui()
 
         # Запуск рендерера
         self.renderer.start()
         self.renderer.set_thresholds(self.thresholds)
         self.renderer.set_noise_gate(0.01 if self.noise_gate_enabled.get() else 0.0)
-        self.renderer.set_idle(self.idle_enabled.get(), self.idle_timeout.get())
+        self.renderer.set_idle(self.idle_enabled.get(), self.idle_timeout.get(),
+                               self.settings.get('idle_fade', 1.0))
 
         # Применение начальных состояний
         self.update_active_states()
@@ -266,9 +287,11 @@ class App:
             self.audio.stop()
         except:
             pass
-        self.audio = AudioProcessor(callback=self.on_audio_level, device=device_name)
+        self.audio = self.create_audio(device_name)
         self.toggle_noise_gate()
         self.audio.start()
+        if self.webserver:
+            self.webserver.set_audio(self.audio)
 
     def toggle_noise_gate(self):
         """Переключение подавления шума"""
@@ -289,6 +312,10 @@ class App:
         self.renderer.set_effects(effects)
         return effects
 
+    def update_sensitivity(self, value=None):
+        """Обновление чувствительности для потока звука"""
+        self.sensitivity_value = self.sensitivity.get()
+
     def update_idle_setting(self):
         """Обновление настройки idle-режима"""
         enabled = self.idle_enabled.get()
@@ -306,7 +333,9 @@ class App:
     
     def save_settings(self):
         """Сохранение настроек"""
-        settings = {
+        # Ключи без элементов интерфейса сохраняются как были в файле
+        settings = dict(self.settings)
+        settings.update({
             'thresholds': self.thresholds,
             'active_states': {state: var.get() for state, var in self.state_vars.items()},
             'effects': self.get_effects(),
@@ -315,7 +344,7 @@ class App:
             'mic_device': self.device_var.get(),
             'idle_enabled': self.idle_enabled.get(),
             'idle_timeout': self.idle_timeout.get()
-        }
+        })
         try:
             with open(SETTINGS_FILE, 'w') as f:
                 json.dump(settings, f, indent=2)
@@ -448,18 +477,18 @@ class App:
             if not answer:
                 return
 
-            self.renderer.model = {"name": f"Слот {idx+1}", "layers": [], "groups": []}
-            self.renderer.model_dir = slot_dir
+            data = {"name": f"Слот {idx+1}", "layers": [], "groups": []}
             os.makedirs(slot_dir, exist_ok=True)
 
             with open(json_path, "w", encoding="utf-8") as f:
-                json.dump(self.renderer.model, f, indent=2, ensure_ascii=False)
+                json.dump(data, f, indent=2, ensure_ascii=False)
         else:
             with open(json_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            self.renderer.load_model(data, slot_dir)
+        # Модель загружается в фоне, рендерер подменит ее, когда она будет готова
+        self.renderer.load_model(data, slot_dir)
 
-        model_name = self.renderer.model.get('name','модель')
+        model_name = data.get('name','модель')
         self.model_slots[idx].config(text=f"Слот {idx+1}\n{model_name}")
 
         preview_path = os.path.join(slot_dir, "preview.png")
@@ -488,7 +517,9 @@ class App:
                 device=self.device_var.get(),
                 noise_gate_enabled=self.noise_gate_enabled.get(),
                 sensitivity=self.sensitivity.get(),
-                thresholds=self.thresholds
+                thresholds=self.thresholds,
+                compositor=self.settings.get('compositor', 'pillow'),
+                clock=self.clock
             )
             
             editor.protocol("WM_DELETE_WINDOW", lambda: self.on_editor_close(editor))
@@ -515,12 +546,11 @@ class App:
         
         try:
             self.audio.stop()
-            self.audio = AudioProcessor(
-                callback=self.on_audio_level,
-                device=self.device_var.get()
-            )
+            self.audio = self.create_audio(self.device_var.get())
             self.audio.noise_gate_threshold = 0.01 if self.noise_gate_enabled.get() else 0.0
             self.audio.start()
+            if self.webserver:
+                self.webserver.set_audio(self.audio)
         except Exception as e:
             print("Ошибка перезапуска аудио:", e)
         
@@ -538,22 +568,40 @@ class App:
             self.webserver.stop()
             self.server_btn.config(text="Запустить веб-сервер")
         else:
-            self.webserver = WebServer(self.renderer)
+            self.webserver = WebServer(self.renderer, audio=self.audio)
             self.webserver.start()
             self.server_btn.config(text="Остановить веб-сервер")
 
+    def create_audio(self, device):
+        """Аудиопроцессор с режимом расчета уровня из настроек"""
+        return AudioProcessor(callback=self.on_audio_level, device=device,
+                              level_mode=self.settings.get('audio_level_mode', 'thread'),
+                              clock=self.clock)
+
+    def poll_level_ui(self):
+        """Индикатор уровня в режиме callback обновляется из потока интерфейса"""
+        level = getattr(self, 'audio_level_scaled', 0.0)
+        try:
+            self.vol_label.config(text=f"Уровень: {level:.2f}")
+        except:
+            pass
+        self.update_level_indicator(level)
+        self.root.after(50, self.poll_level_ui)
+
     def on_audio_level(self, level):
         """Обработка уровня аудио"""
-        try:
-            self.audio_level_scaled = level * self.sensitivity.get()
-        except Exception:
-            self.audio_level_scaled = level
+        self.audio_level_scaled = level * self.sensitivity_value
+        if self.audio.level_mode == "callback":
+            # Вызов из callback PortAudio: только рендерер, интерфейс - в poll_level_ui
+            self.renderer.set_audio_level(self.audio_level_scaled, self.audio.last_capture_time)
+            return
         try:
             self.vol_label.config(text=f"Уровень: {self.audio_level_scaled:.2f}")
         except:
             pass
         self.update_level_indicator(self.audio_level_scaled)
-        self.renderer.set_audio_level(self.audio_level_scaled)
+        self.renderer.set_audio_level(self.audio_level_scaled,
+                                      getattr(self.audio, 'last_capture_time', None))
 
     def on_close(self):
         """Обработка закрытия приложения"""
@@ -0,0 +1,124 @@
+from layer_cache import get_layer_cache
+
+PREFIX = "webpngtuber"
+
+def _hit_rate(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
+
+def collect_stats(renderer, audio=None):
+    """Сводка для /debug/stats и /metrics"""
+    frames = renderer.get_frame_stats()
+    layer_cache = get_layer_cache()
+    stats = {
+        'render': {
+            'target_fps': renderer.fps,
+            # Темп тиков сейчас: fps, idle_fps без клиентов или 0 в адаптивном режиме
+            'tick_fps': frames['target_fps'],
+            'achieved_fps': renderer.frame_rate.rate(),
+            'adaptive': renderer.adaptive,
+            'frames': renderer.frame_seq,
+            'ticks': frames['ticks'],
+            'missed': frames['missed'],
+        },
+        'frame_ms': {
+            'render': frames['render_ms'],
+            'encode': frames['encode_ms'],
+            'tick': frames['tick_ms'],
+            'lateness': frames['lateness_ms'],
+        },
+        'frame_bytes': renderer.frame_sizes.stats(),
+        'encoder': renderer.get_encoder_stats(),
+        'clients': {
+            'stream': renderer.stream_clients,
+            'state': renderer.state_clients,
+        },
+        'latency': renderer.get_latency_stats(),
+        'compose': renderer.get_compose_stats(),
+        'caches': {
+            'scene': renderer.get_scene_cache_stats(),
+            'pulse': renderer.get_pulse_stats(),
+            # Полная статистика кэша слоев обходит папку на диске, здесь только счетчики
+            'layer': {
+                'hits': layer_cache.hits,
+                'misses': layer_cache.misses,
+                'hit_rate': _hit_rate(layer_cache.hits, layer_cache.misses),
+            },
+        },
+        'audio': audio.get_stats() if audio is not None else None,
+    }
+    return stats
+
+class _Writer:
+    """Текстовый формат Prometheus: HELP/TYPE и строки значений"""
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """samples - список ({метка: значение}, значение)"""
+        name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{self._labels(labels)} {float(value):.6g}")
+
+    def summary(self, name, help_text, stats, scale, labels=None):
+        """Перцентили из FrameTimeHistogram.stats(), умноженные на scale"""
+        labels = labels or {}
+        name = f"{PREFIX}_{name}"
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} summary")
+        for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+            sample_labels = dict(labels, quantile=quantile)
+            self.lines.append(f"{name}{self._labels(sample_labels)} {stats[key] * scale:.6g}")
+        self.lines.append(f"{name}_count{self._labels(labels)} {stats['count']}")
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+def prometheus_text(stats):
+    """Метрики из collect_stats в текстовом формате Prometheus"""
+    out = _Writer()
+    render = stats['render']
+    out.metric("target_fps", "gauge", "Заданная частота кадров", [({}, render['target_fps'])])
+    out.metric("achieved_fps", "gauge", "Фактическая частота закодированных кадров",
+               [({}, render['achieved_fps'])])
+    out.metric("frames_total", "counter", "Закодированные кадры", [({}, render['frames'])])
+    out.metric("ticks_total", "counter", "Тики цикла рендеринга", [({}, render['ticks'])])
+    out.metric("frames_missed_total", "counter", "Пропущенные дедлайны тиков", [({}, render['missed'])])
+    for stage, help_text in (("render", "Сборка сцены и композиция кадра"),
+                             ("encode", "Кодирование кадра"),
+                             ("tick", "Вся работа тика")):
+        out.summary(f"{stage}_seconds", f"{help_text}, секунды", stats['frame_ms'][stage], 0.001)
+    out.summary("frame_bytes", "Размер закодированного кадра, байты", stats['frame_bytes'], 1)
+    out.summary("latency_seconds", "Задержка от блока звука до отправки кадра, секунды",
+                stats['latency']['total_ms'], 0.001)
+    out.metric("clients", "gauge", "Подключенные клиенты",
+               [({'kind': kind}, count) for kind, count in stats['clients'].items()])
+    out.metric("cache_hit_ratio", "gauge", "Доля попаданий в кэш",
+               [({'cache': name}, cache['hit_rate']) for name, cache in stats['caches'].items()])
+    compose = stats['compose']
+    out.metric("compose_total", "counter", "Композиции кадра по способу",
+               [({'kind': kind}, compose[kind]) for kind in ('full', 'partial', 'cached')])
+
+    audio = stats['audio']
+    if audio is not None:
+        out.metric("audio_level", "gauge", "Текущий уровень звука", [({}, audio['level'])])
+        out.metric("audio_callback_rate", "gauge", "Вызовы callback звуковой карты в секунду",
+                   [({}, audio['callback_rate'])])
+        out.metric("audio_callbacks_total", "counter", "Вызовы callback звуковой карты",
+                   [({}, audio['callbacks'])])
+        out.metric("audio_queue_depth", "gauge", "Необработанные блоки звука",
+                   [({}, audio['queue_depth'])])
+        ring = audio['ring']
+        out.metric("audio_overflows_total", "counter", "Переполнения кольцевого буфера звука",
+                   [({}, ring['overflows'])])
+        out.metric("audio_underruns_total", "counter", "Ожидания блока звука дольше нормы",
+                   [({}, ring['underruns'])])
+    return out.text()
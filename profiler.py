@@ -0,0 +1,54 @@
+import os, sys, time
+from collections import Counter
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def sample_thread(thread, seconds, interval=0.005):
+    """Семплирующий профиль потока.
+
+    Каждые interval секунд снимается стек потока через
+    sys._current_frames(); сам поток не останавливается и не
+    инструментируется, поэтому профиль можно снимать на работающем
+    приложении. Возвращает Counter стеков (кортеж функций от корня) ->
+    число снимков.
+    """
+    stacks = Counter()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline and thread.is_alive():
+        frame = sys._current_frames().get(thread.ident)
+        if frame is None:
+            break
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        stacks[tuple(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+def summarize(stacks, top=30):
+    """Функции с наибольшим собственным и общим числом снимков"""
+    samples = sum(stacks.values())
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for name in set(stack):
+            total[name] += count
+
+    def rows(counter):
+        return [{'function': name, 'samples': count, 'percent': count / samples * 100}
+                for name, count in counter.most_common(top)]
+
+    return {
+        'samples': samples,
+        'self': rows(own) if samples else [],
+        'total': rows(total) if samples else [],
+    }
+
+def collapsed(stacks):
+    """Стеки в формате flamegraph.pl: "корень;...;функция число" """
+    return "\n".join(f"{';'.join(stack)} {count}"
+                     for stack, count in sorted(stacks.items(), key=lambda item: -item[1]))
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict
+from layer_cache import RESAMPLE_FILTERS
+
+# Максимальное отклонение масштаба при пульсации (при уровне звука 1.0)
+PULSE_AMPLITUDE = 0.1
+
+class PulsePyramid:
+    """Заранее масштабированные копии слоев для эффекта пульсации.
+
+    Диапазон масштабов 1 +- PULSE_AMPLITUDE делится на steps ступеней, и
+    каждый кадр берет ближайшую ступень вместо resize каждого слоя. Число
+    ступеней нечетное, чтобы средняя ступень давала ровно 1.0: на ней
+    слой рисуется без масштабирования. Копии
+    хранятся в LRU-кэше с бюджетом памяти; ключ - id исходного изображения
+    и ступень, само изображение хранится в записи, чтобы id не
+    переиспользовался.
+    """
+    def __init__(self, steps=33, resample="LANCZOS", budget_mb=64):
+        self._lock = threading.Lock()
+        self._images = OrderedDict()  # (id изображения, ступень) -> (изображение, копия)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.configure(steps, resample, budget_mb)
+
+    def configure(self, steps=33, resample="LANCZOS", budget_mb=64):
+        """Настройка числа ступеней, фильтра и бюджета (кэш сбрасывается)"""
+        if resample not in RESAMPLE_FILTERS:
+            print(f"Неизвестный фильтр пульсации: {resample}, используется LANCZOS")
+            resample = "LANCZOS"
+        with self._lock:
+            steps = max(3, int(steps))
+            self.steps = steps if steps % 2 else steps + 1
+            self.neutral = self.steps // 2
+            self.resample = resample
+            self.budget_bytes = max(0, int(float(budget_mb) * 1024 * 1024))
+            self._images.clear()
+            self._size = 0
+
+    def step_for(self, scale):
+        """Ближайшая ступень масштаба"""
+        position = self.neutral + (scale - 1.0) / PULSE_AMPLITUDE * self.neutral
+        return max(0, min(self.steps - 1, int(round(position))))
+
+    def scale_for(self, step):
+        """Масштаб ступени (на средней ступени - ровно 1.0)"""
+        return 1.0 + PULSE_AMPLITUDE * (step - self.neutral) / self.neutral
+
+    def size_for(self, image, step):
+        """Размер слоя на ступени"""
+        scale = self.scale_for(step)
+        return (max(1, int(image.width * scale)), max(1, int(image.height * scale)))
+
+    def get(self, image, step):
+        """Масштабированная копия слоя для ступени"""
+        if step == self.neutral:
+            return image
+        key = (id(image), step)
+        with self._lock:
+            entry = self._images.get(key)
+            if entry is not None and entry[0] is image:
+                self._images.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        scaled = image.resize(self.size_for(image, step), RESAMPLE_FILTERS[self.resample])
+        self._put(key, image, scaled)
+        return scaled
+
+    def _put(self, key, image, scaled):
+        size = scaled.width * scaled.height * 4
+        with self._lock:
+            if size > self.budget_bytes:
+                return
+            old = self._images.pop(key, None)
+            if old is not None:
+                self._size -= old[1].width * old[1].height * 4
+            self._images[key] = (image, scaled)
+            self._size += size
+            while self._size > self.budget_bytes:
+                _, (_, evicted) = self._images.popitem(last=False)
+                self._size -= evicted.width * evicted.height * 4
+
+    def prepare(self, images, cancelled=lambda: False):
+        """Предварительное масштабирование слоев, пока хватает бюджета.
+
+        Ступени считаются от масштаба 1.0 к краям диапазона: при тихом
+        голосе пульсация не выходит за ближайшие ступени. Средней ступени
+        копия не нужна.
+        """
+        neutral = self.neutral
+        steps = sorted((step for step in range(self.steps) if step != neutral),
+                       key=lambda step: abs(step - neutral))
+        for step in steps:
+            for image in images:
+                if cancelled():
+                    return
+                with self._lock:
+                    scaled_size = self.size_for(image, step)
+                    if self._size + scaled_size[0] * scaled_size[1] * 4 > self.budget_bytes:
+                        return
+                    if (id(image), step) in self._images:
+                        continue
+                self._put((id(image), step), image,
+                          image.resize(scaled_size, RESAMPLE_FILTERS[self.resample]))
+
+    def clear(self):
+        with self._lock:
+            self._images.clear()
+            self._size = 0
+
+    def stats(self):
+        """Статистика кэша ступеней"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'steps': self.steps,
+                'resample': self.resample,
+                'entries': len(self._images),
+                'size_mb': self._size / (1024 * 1024),
+                'budget_mb': self.budget_bytes / (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
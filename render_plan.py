@@ -0,0 +1,162 @@
+import itertools
+from atlas import load_model_layers
+from dirty_rects import alpha_bbox
+
+# Порядок состояний по громкости
+STATE_ORDER = ('silent', 'whisper', 'normal', 'shout')
+
+# Значения выбора слоя группы (кроме индекса слоя)
+ALL_CHILDREN = -1  # Выбора нет, рисуются все слои группы
+NO_LAYER = -2      # Выбран слой, которого нет в модели
+
+# Ключевые слова для поиска слоя моргания без явной логики
+BLINK_KEYWORDS = ("close", "closed", "shut", "blink")
+
+class LayerPlan:
+    """Слой модели с заранее вычисленными параметрами"""
+    __slots__ = ("index", "name", "group", "x", "y", "visible",
+                 "image", "frames", "durations", "cx", "cy")
+
+    def __init__(self, index, name, group, x, y, visible, image, frames, durations, width, height):
+        self.index = index
+        self.name = name
+        self.group = group          # индекс группы или -1
+        self.x = x
+        self.y = y
+        self.visible = visible
+        self.image = image          # статичное изображение (None для GIF)
+        self.frames = frames        # кадры GIF (None для статичных слоев)
+        self.durations = durations
+        # Позиция левого верхнего угла без эффектов
+        if image is not None or frames:
+            w, h = (image or frames[0]).size
+            self.cx = (width - w) // 2 + x
+            self.cy = (height - h) // 2 + y
+        else:
+            self.cx = self.cy = 0
+
+class GroupPlan:
+    """Группа модели с таблицами выбора дочернего слоя по индексам"""
+    __slots__ = ("index", "name", "blink_freq", "blink_choice", "open_choice", "voice",
+                 "random_effect", "random_min", "random_max", "random_choices")
+
+    def __init__(self, index, name, blink_freq, blink_choice, open_choice, voice,
+                 random_effect, random_min, random_max, random_choices):
+        self.index = index
+        self.name = name
+        self.blink_freq = blink_freq
+        self.blink_choice = blink_choice      # выбор при моргании или None
+        self.open_choice = open_choice        # выбор состояния "open" или None
+        self.voice = voice                    # выбор для каждого состояния STATE_ORDER или None
+        self.random_effect = random_effect
+        self.random_min = random_min
+        self.random_max = random_max
+        self.random_choices = random_choices  # кандидаты случайного эффекта
+
+class RenderPlan:
+    """Готовый к отрисовке снимок модели.
+
+    Собирается целиком в фоновом потоке и после этого не изменяется:
+    рендерер подменяет текущий план новым одной операцией и до этого
+    продолжает рисовать старую модель. Слои и группы хранятся в кортежах,
+    связи между ними - индексами, поэтому покадровый цикл не обращается
+    к JSON модели.
+    """
+    def __init__(self, model, model_dir, version, layers, groups, draw_layers,
+                 images, gif_frames, gif_frame_times):
+        self.model = model
+        self.model_dir = model_dir
+        self.version = version
+        self.layers = layers                    # все слои модели
+        self.groups = groups
+        self.draw_layers = draw_layers          # видимые слои с изображениями
+        self.images = images                    # имя слоя -> изображение
+        self.gif_frames = gif_frames            # имя слоя -> [кадры]
+        self.gif_frame_times = gif_frame_times  # имя слоя -> [длительности]
+        # Непрозрачные области всех изображений и кадров: id -> bbox или None.
+        # План хранит сами изображения, поэтому их id не переиспользуются
+        self.boxes = {id(image): alpha_bbox(image)
+                      for image in itertools.chain(images.values(), *gif_frames.values())}
+
+def compile_render_plan(model_json, model_dir, version, images, gif_frames, gif_frame_times,
+                        width=700, height=700):
+    """Компиляция JSON модели в план с индексами вместо имен"""
+    raw_layers = model_json.get("layers", [])
+    raw_groups = model_json.get("groups", [])
+
+    layer_index = {}
+    for i, layer in enumerate(raw_layers):
+        layer_index.setdefault(layer.get("name"), i)
+    # При повторяющихся именах групп действует последняя, как и в словаре выбора
+    group_index = {g.get("name"): i for i, g in enumerate(raw_groups)}
+
+    def choice(name):
+        if not name:
+            return ALL_CHILDREN
+        return layer_index.get(name, NO_LAYER)
+
+    groups = []
+    for i, g in enumerate(raw_groups):
+        logic = g.get("logic", {})
+        children = g.get("children", [])
+        if "blink" in logic:
+            blink_choice = choice(logic["blink"])
+        else:
+            blink_choice = None
+            for child in children:
+                if any(kw in child.lower() for kw in BLINK_KEYWORDS):
+                    blink_choice = choice(child)
+                    break
+        open_layer = logic.get("open")
+        blink_layer = logic.get("blink", "")
+        groups.append(GroupPlan(
+            index=i,
+            name=g.get("name"),
+            blink_freq=float(g.get("blink_freq", 0.0)),
+            blink_choice=blink_choice,
+            open_choice=choice(open_layer) if open_layer else None,
+            voice=tuple(choice(logic[state]) if state in logic else None for state in STATE_ORDER),
+            random_effect=bool(g.get("random_effect", False)),
+            random_min=g.get("random_min", 5.0),
+            random_max=g.get("random_max", 10.0),
+            random_choices=tuple(choice(c) for c in children
+                                 if c != blink_layer and c != (open_layer or "")),
+        ))
+
+    layers = []
+    for i, layer in enumerate(raw_layers):
+        name = layer.get("name")
+        group_name = layer.get("group")
+        layers.append(LayerPlan(
+            index=i,
+            name=name,
+            group=group_index.get(group_name, -1) if group_name else -1,
+            x=int(layer.get("x", 0)),
+            y=int(layer.get("y", 0)),
+            visible=bool(layer.get("visible", True)),
+            image=images.get(name) if name not in gif_frames else None,
+            frames=gif_frames.get(name),
+            durations=gif_frame_times.get(name),
+            width=width,
+            height=height,
+        ))
+    draw_layers = tuple(l for l in layers
+                        if l.visible and (l.image is not None or l.frames))
+
+    return RenderPlan(model_json, model_dir, version, tuple(layers), tuple(groups),
+                      draw_layers, images, gif_frames, gif_frame_times)
+
+def build_render_plan(model_json, model_dir, version, width=700, height=700):
+    """Сборка плана отрисовки: загрузка всех изображений слоев модели"""
+    images = {}
+    gif_frames = {}
+    gif_frame_times = {}
+    # Слои берутся из атласа модели, который пересобирается при изменении исходников
+    for name, (frames, durations) in load_model_layers(model_json, model_dir).items():
+        if durations:
+            gif_frames[name] = frames
+            gif_frame_times[name] = durations
+        else:
+            images[name] = frames[0]
+    return compile_render_plan(model_json, model_dir, version, images, gif_frames,
+                               gif_frame_times, width, height)
@@ -1,18 +1,92 @@
 import threading, time
-from PIL import Image, ImageEnhance, ImageSequence
-import os, io, math, random
+from PIL import ImageSequence
+import math, random, itertools, copy
+from scene_cache import SceneCache
+from encoders import PngEncoder
+from compositor import PillowCompositor
+from pulse import PulsePyramid, PULSE_AMPLITUDE
+from scheduler import FrameScheduler, FrameTimeHistogram, RateMeter
+from latency import LatencyTracker
+from clock import RealClock
+from broadcaster import FrameBroadcaster
+from render_plan import build_render_plan, STATE_ORDER, ALL_CHILDREN
+from dirty_rects import diff_draws, clip_rect, offset_rect, rect_area
+
+# Запас по высоте для базовых кадров в кэше (максимальная амплитуда прыжков)
+SCENE_CACHE_MARGIN = 10
+# Доля площади кадра, выше которой грязные области перерисовываются целиком
+DIRTY_FULL_RATIO = 0.5
+# Число ступеней яркости при плавном переходе в idle-режим и обратно
+IDLE_FADE_STEPS = 16
+# Максимальная пауза между тиками в адаптивном режиме (секунды)
+ADAPTIVE_MAX_SLEEP = 1.0
+# Запас после дедлайна таймера: таймеры срабатывают строго после своего времени
+TIMER_EPSILON = 0.001
+
+class Scene:
+    """Описание кадра, собранное за один тик"""
+    __slots__ = ("signature", "plan", "choices", "draws", "idle", "fade_step", "brightness",
+                 "base_key", "offset_y", "model_version", "dirty", "gif_deadline")
+
+    def __init__(self):
+        self.signature = ()
+        self.plan = None
+        self.choices = ()
+        self.draws = []
+        self.idle = False
+        self.fade_step = 0      # ступень затемнения от 0 до IDLE_FADE_STEPS
+        self.brightness = 1.0
+        self.base_key = None
+        self.offset_y = 0
+        self.model_version = 0
+        self.dirty = None  # области, изменившиеся с прошлого кадра (None - весь кадр)
+        self.gif_deadline = None  # ближайшая смена кадра видимых GIF
 
 class Renderer:
-    def __init__(self, width=700, height=700, fps=60):
+    def __init__(self, width=700, height=700, fps=60, scene_cache_mb=64, idle_fps=2, clock=None, seed=None):
+        # Часы анимации: таймеры моргания, кадры GIF, эффекты и idle-режим
+        self.clock = clock or RealClock()
+        # Генератор случайных эффектов; с заданным seed сцена воспроизводима
+        self.rng = random.Random(seed)
         self.width = width
         self.height = height
         self.fps = fps
+        self.idle_fps = idle_fps  # Частота тиков без подключенных клиентов
         self._running = False
         self._thread = None
         self._frame_bytes = None
+        self._frame_seq = 0
+        self._frame_mimetype = "image/png"
+        self._last_signature = None
         self._lock = threading.Lock()
-        self.model = None
-        self.model_dir = None
+        self._frame_ready = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self.scheduler = FrameScheduler()
+        # Фактическая частота закодированных кадров и их размер в байтах
+        self.frame_rate = RateMeter()
+        self.frame_sizes = FrameTimeHistogram(scale=1.0)
+        self.latency = LatencyTracker()
+        # Адаптивный режим: тик только при изменении сцены, а не fps раз в секунду
+        self.adaptive = False
+        self._voice_state = ()
+        self._snapshot_pending = False
+        # Состояние сцены для клиентов, собирающих кадр сами
+        self._scene_cond = threading.Condition()
+        self._scene_seq = 0
+        self._scene_state = None
+        self._scene_signature = None
+        self._state_clients = 0
+        # Рассылка закодированных кадров клиентам потока
+        self.broadcaster = FrameBroadcaster()
+        # Текущий план отрисовки модели и план, ожидающий подмены
+        self.plan = None
+        self._pending_plan = None
+        self._load_generation = 0
+        self.load_stats = {}
+        # Растет при каждой загрузке модели; начинается с времени запуска,
+        # чтобы не совпадать с версиями, закэшированными браузером ранее
+        self.model_version = int(time.time() * 1000)
+        self._last_version = self.model_version
         self.audio_level = 0.0
         self.group_blink_timers = {}
         self.group_blink_until = {}
@@ -32,36 +106,57 @@ class Renderer:
             'shout': True
         }
         
-        # Порядок состояний по громкости
-        self.state_order = ['silent', 'whisper', 'normal', 'shout']
         self.effects = {}
         
         # Для случайного эффекта
         self.group_random_timers = {}
         self.group_random_current = {}
         
-        # Для GIF анимации
-        self._gif_frames = {}
-        self._gif_frame_times = {}
-        self._gif_last_update = {}
-        self._gif_current_frame = {}
+        # Для GIF анимации (по индексам слоев плана)
+        self._gif_last_update = []
+        self._gif_current_frame = []
 
         # Idle режим
         self.idle_enabled = False
         self.idle_timeout = 60.0  # seconds
-        self.last_activity_time = time.time()
+        self.last_activity_time = self.clock.time()
         self.idle_brightness = 0.5  # Яркость в idle-режиме (0.0 - черный, 1.0 - оригинал)
+        self.idle_fade = 1.0  # Длительность перехода в idle-режим и обратно (секунды)
+        self._idle_level = 0.0  # 0.0 - обычный вид, 1.0 - полное затемнение
+        self._idle_updated = self.clock.time()
+
+        # Кэш готовых кадров по комбинации выбранных слоев
+        self.scene_cache = SceneCache(scene_cache_mb)
+        self.scene_cache_warmup = False
+
+        # Базовый кадр прошлой композиции, который обновляется по грязным областям
+        self._base = None
+        self._base_draws = None
+        self._base_version = None
+        self._base_shared = False  # базовый кадр лежит в кэше сцен и не изменяется
+        self._last_composed = None
+        self.compose_stats = {'full': 0, 'partial': 0, 'cached': 0, 'dirty_pixels': 0}
 
-    def set_idle(self, enabled, timeout):
+        # Масштабированные копии слоев для пульсации
+        self.pulse = PulsePyramid()
+
+        # Компоновщик слоев и кодировщик кадров
+        self.compositor = PillowCompositor()
+        self._base_compositor = self.compositor
+        self.encoder = PngEncoder()
+
+    def set_idle(self, enabled, timeout, fade=None):
         self.idle_enabled = enabled
         self.idle_timeout = timeout
+        if fade is not None:
+            self.idle_fade = max(0.0, float(fade))
         # Сбросим таймер при изменении настроек
-        self.last_activity_time = time.time()
+        self.last_activity_time = self.clock.time()
         
         # Принудительно обновим состояние активности
         if enabled:
             # Если включен, сбрасываем таймер
-            self.last_activity_time = time.time()
+            self.last_activity_time = self.clock.time()
         else:
             # Если выключен, сбрасываем состояние бездействия
             # Это нужно, чтобы изображение сразу вернулось к нормальному виду
@@ -73,7 +168,36 @@ class Renderer:
 
     def set_effects(self, effects):
         """Установка эффектов"""
+        pulse_enabled = effects.get('pulse', False) and not self.effects.get('pulse', False)
         self.effects = effects
+        if pulse_enabled:
+            self._start_pulse_prepare()
+        self._wake.set()
+
+    def set_pulse(self, steps=33, resample="LANCZOS", cache_mb=64):
+        """Настройка ступеней масштаба для пульсации"""
+        self.pulse.configure(steps, resample, cache_mb)
+        if self.effects.get('pulse', False):
+            self._start_pulse_prepare()
+
+    def get_pulse_stats(self):
+        """Статистика кэша ступеней пульсации"""
+        return self.pulse.stats()
+
+    def _start_pulse_prepare(self):
+        """Масштабирование слоев текущей модели в фоновом потоке"""
+        plan = self.plan
+        if plan is None:
+            return
+        images = []
+        for layer in plan.draw_layers:
+            images.extend(layer.frames if layer.frames is not None else [layer.image])
+
+        def cancelled():
+            return plan is not self.plan or not self.effects.get('pulse', False)
+
+        thread = threading.Thread(target=self.pulse.prepare, args=(images, cancelled), daemon=True)
+        thread.start()
 
     def set_thresholds(self, thresholds):
         """Установка порогов голоса"""
@@ -94,263 +218,757 @@ class Renderer:
     def stop(self):
         """Остановка рендерера"""
         self._running = False
+        self._wake.set()
         if self._thread:
             self._thread.join(timeout=1.0)
 
-    def load_model(self, model_json, model_dir):
-        """Загрузка модели"""
-        self.model = model_json
-        self.model_dir = model_dir
-        self._image_cache = {}
-        self._gif_frames = {}
-        self._gif_frame_times = {}
-        self._gif_last_update = {}
-        self._gif_current_frame = {}
-        
-        for layer in self.model.get("layers", []):
-            filename = layer.get("file")
-            if not filename:
-                continue
-                
-            fp = os.path.join(self.model_dir, filename)
-            if not os.path.exists(fp):
-                continue
-                
-            try:
-                scale = float(layer.get("scale", 1.0))
-                rotation = int(layer.get("rotation", 0))
-
-                # Обработка GIF
-                if layer.get("is_gif", False):
-                    self._gif_frames[layer.get("name")] = []
-                    self._gif_frame_times[layer.get("name")] = []
-                    self._gif_current_frame[layer.get("name")] = 0
-                    self._gif_last_update[layer.get("name")] = 0
-                    img = Image.open(fp)
-                    
-                    for frame in range(img.n_frames):
-                        img.seek(frame)
-                        frame_img = img.copy().convert("RGBA")
-                        if scale != 1.0:
-                            new_width = int(frame_img.width * scale)
-                            new_height = int(frame_img.height * scale)
-                            frame_img = frame_img.resize((new_width, new_height), Image.LANCZOS)
-                        if rotation != 0:
-                            frame_img = frame_img.rotate(rotation, expand=True)
-                        self._gif_frames[layer.get("name")].append(frame_img)
-                        try:
-                            duration = img.info.get('duration', 100) / 1000.0
-                            self._gif_frame_times[layer.get("name")].append(duration)
-                        except:
-                            self._gif_frame_times[layer.get("name")].append(0.1)
-                else:
-                    image = Image.open(fp).convert("RGBA")
-                    if scale != 1.0:
-                        new_width = int(image.width * scale)
-                        new_height = int(image.height * scale)
-                        image = image.resize((new_width, new_height), Image.LANCZOS)
-                    if rotation != 0:
-                        image = image.rotate(rotation, expand=True)
-                    self._image_cache[layer.get("name")] = image
-            except Exception as e:
-                print(f"Ошибка загрузки изображения: {e}")
+    @property
+    def model(self):
+        """JSON текущей модели"""
+        plan = self.plan
+        return plan.model if plan else None
+
+    @property
+    def model_dir(self):
+        """Папка текущей модели"""
+        plan = self.plan
+        return plan.model_dir if plan else None
+
+    def load_model(self, model_json, model_dir, wait=False):
+        """Загрузка модели.
+
+        План отрисовки собирается в фоновом потоке, рендерер продолжает
+        рисовать старую модель и подменяет ее, когда новая готова целиком.
+        При wait=True метод возвращается после подмены модели.
+        """
+        requested = time.perf_counter()
+        # Копия, чтобы дальнейшие правки в редакторе не меняли план
+        model = copy.deepcopy(model_json)
+        with self._lock:
+            self._load_generation += 1
+            generation = self._load_generation
+            self._last_version += 1
+            version = self._last_version
+        args = (generation, model, model_dir, version, requested)
+        if not wait:
+            threading.Thread(target=self._load_worker, args=args, daemon=True).start()
+            return
+        self._load_worker(*args)
+        if self._running:
+            with self._frame_ready:
+                self._frame_ready.wait_for(
+                    lambda: self.model_version >= version or self._load_generation != generation,
+                    timeout=5.0)
+
+    def _load_worker(self, generation, model, model_dir, version, requested):
+        """Сборка плана отрисовки в фоне"""
+        start = time.perf_counter()
+        try:
+            plan = build_render_plan(model, model_dir, version, self.width, self.height)
+        except Exception as e:
+            print(f"Ошибка загрузки модели: {e}")
+            return
+        load_time = time.perf_counter() - start
+        with self._lock:
+            # Более поздний запрос загрузки отменяет этот
+            if generation != self._load_generation:
+                return
+            self._pending_plan = (plan, requested, load_time)
+        if self._running:
+            self._wake.set()
+        else:
+            self._install_pending_plan()
+
+    def _install_pending_plan(self):
+        """Подмена текущего плана готовым (в потоке рендеринга)"""
+        with self._lock:
+            pending = self._pending_plan
+            self._pending_plan = None
+        if pending is None:
+            return
+        plan, requested, load_time = pending
+
+        self._gif_last_update = [None] * len(plan.layers)
+        self._gif_current_frame = [0] * len(plan.layers)
         
         # Инициализация эффектов
-        for g in self.model.get("groups", []):
-            name = g.get("name")
+        for g in plan.groups:
+            name = g.name
             if name not in self.group_blink_timers:
-                self.group_blink_timers[name] = time.time() + random.uniform(2.0,6.0)
+                self.group_blink_timers[name] = self.clock.time() + self.rng.uniform(2.0,6.0)
                 self.group_blink_until[name] = 0.0
             
             # Инициализация случайного эффекта
-            if g.get("random_effect", False):
-                self.group_random_timers[name] = time.time()
+            if g.random_effect:
+                self.group_random_timers[name] = self.clock.time()
                 self.group_random_current[name] = None
 
-    def set_audio_level(self, level):
-        """Установка уровня аудио"""
+        self.scene_cache.clear()
+        self.compositor.clear()
+        self.compositor.set_boxes(plan.boxes)
+        self.pulse.clear()
+        with self._frame_ready:
+            self.plan = plan
+            self.model_version = plan.version
+            self._frame_ready.notify_all()
+
+        installed = time.perf_counter()
+        self.load_stats = {
+            'load_ms': load_time * 1000,
+            'swap_ms': (installed - requested - load_time) * 1000,
+            'total_ms': (installed - requested) * 1000,
+        }
+        if self.scene_cache_warmup:
+            self._start_scene_cache_warmup()
+        if self.effects.get('pulse', False):
+            self._start_pulse_prepare()
+
+    def get_load_stats(self):
+        """Время сборки плана последней модели и задержка ее подмены"""
+        return dict(self.load_stats)
+
+    def set_audio_level(self, level, captured_at=None):
+        """Установка уровня аудио.
+
+        captured_at - время получения блока в callback PortAudio
+        (time.perf_counter) для замера задержки.
+        """
         if level < self.noise_gate:
             level = 0.0
         self.audio_level = max(0.0, float(level))
         # Если есть звук выше порога шумодава, обновляем время активности
         if level > self.noise_gate:
-            self.last_activity_time = time.time()
+            self.last_activity_time = self.clock.time()
+        # Смена состояния голоса рисуется без ожидания следующего тика
+        voice_state = tuple(self._voice_candidates())
+        if voice_state != self._voice_state:
+            self._voice_state = voice_state
+            self.latency.begin(captured_at)
+            self._wake.set()
+        elif self.adaptive and self._idle_level > 0 and level > self.noise_gate:
+            # Выход из idle в адаптивном режиме
+            self._wake.set()
+
+    def set_adaptive(self, enabled):
+        """Адаптивная частота кадров: тики по событиям сцены вместо постоянного fps"""
+        self.adaptive = bool(enabled)
+        self._wake.set()
+
+    def get_layer_assets(self):
+        """Изображения слоев текущей модели после масштаба и поворота.
+
+        Возвращает (версия модели, [(имя слоя, [кадры])]) в порядке слоев модели.
+        """
+        plan = self.plan
+        assets = []
+        if plan is None:
+            return self.model_version, assets
+        for layer in plan.layers:
+            if layer.frames:
+                assets.append((layer.name, list(layer.frames)))
+            elif layer.image is not None:
+                assets.append((layer.name, [layer.image]))
+        return plan.version, assets
+
+    def get_frame_bytes(self, with_seq=False):
+        """Получение кадра в виде байтов.
 
-    def get_frame_bytes(self):
-        """Получение кадра в виде байтов"""
+        При with_seq=True возвращает кортеж (номер кадра, байты). Номер кадра
+        монотонно растет и меняется только при появлении нового кадра.
+        """
         with self._lock:
+            if with_seq:
+                return self._frame_seq, self._frame_bytes
             return self._frame_bytes
 
-    def _choose_group_child(self, group):
-        """Выбор дочернего элемента группы"""
-        group_name = group.get("name")
-        logic = group.get("logic", {})
+    def set_encoder(self, encoder):
+        """Установка кодировщика кадров"""
+        with self._lock:
+            self.encoder = encoder
+            # Следующий кадр будет закодирован заново в новом формате
+            self._last_signature = None
+
+    def get_frame_mimetype(self):
+        """MIME-тип последнего закодированного кадра"""
+        with self._lock:
+            return self._frame_mimetype
+
+    def get_encoder_stats(self):
+        """Статистика кодировщика: время кодирования и размер кадра"""
+        return self.encoder.stats()
+
+    @property
+    def frame_seq(self):
+        """Номер последнего закодированного кадра"""
+        with self._lock:
+            return self._frame_seq
+
+    def _voice_candidates(self, level=None):
+        """Индексы состояний голоса (STATE_ORDER) в порядке приоритета.
+
+        Первым идет текущее состояние, если оно активно, затем остальные
+        активные состояния, порог которых достигнут, от громкого к тихому.
+        """
+        if level is None:
+            level = self.audio_level
+        thresholds = self.thresholds
+        current = 0
+        if level > thresholds['shout']:
+            current = 3
+        elif level > thresholds['normal']:
+            current = 2
+        elif level > thresholds['whisper']:
+            current = 1
+
+        candidates = []
+        if self.active_states.get(STATE_ORDER[current], True):
+            candidates.append(current)
+        for state in (3, 2, 1, 0):
+            if state == current:
+                continue
+            name = STATE_ORDER[state]
+            if level >= thresholds.get(name, 0) and self.active_states.get(name, True):
+                candidates.append(state)
+        return candidates
+
+    def _choose_group_child(self, group, now, voice_candidates):
+        """Выбор дочернего слоя группы: индекс слоя или ALL_CHILDREN/NO_LAYER"""
+        group_name = group.name
         
         # Обработка моргания
         if self.effects.get('blink', True):
-            now = time.time()
-            blink_freq = float(group.get("blink_freq", 0.0))
-            
             if group_name not in self.group_blink_timers:
-                self.group_blink_timers[group_name] = now + random.uniform(2.0, 6.0)
+                self.group_blink_timers[group_name] = now + self.rng.uniform(2.0, 6.0)
                 self.group_blink_until[group_name] = 0.0
                 
-            if blink_freq > 0.001:
+            if group.blink_freq > 0.001:
                 if now > self.group_blink_timers.get(group_name, 0):
                     self.group_blink_until[group_name] = now + 0.12
-                    self.group_blink_timers[group_name] = now + blink_freq
+                    self.group_blink_timers[group_name] = now + group.blink_freq
                 
-                if now < self.group_blink_until.get(group_name, 0):
-                    if "blink" in logic:
-                        return logic["blink"]
-                    else:
-                        for child in group.get("children", []):
-                            if any(kw in child.lower() for kw in ["close", "closed", "shut", "blink"]):
-                                return child
+                if now < self.group_blink_until.get(group_name, 0) and group.blink_choice is not None:
+                    return group.blink_choice
         
         # Использование состояния "open"
-        open_layer = logic.get("open")
-        if open_layer:
-            return open_layer
+        if group.open_choice is not None:
+            return group.open_choice
         
         # Обработка случайного эффекта
-        if group.get("random_effect", False) and self.effects.get('random_effect', False):
-            now = time.time()
-            min_time = group.get("random_min", 5.0)
-            max_time = group.get("random_max", 10.0)
-            
+        if group.random_effect and self.effects.get('random_effect', False):
             if now > self.group_random_timers.get(group_name, 0):
-                children = group.get("children", [])
-                if children:
-                    blink_layer = logic.get("blink", "")
-                    open_layer = logic.get("open", "")
-                    available = [c for c in children if c != blink_layer and c != open_layer]
-                    
-                    if available:
-                        chosen = random.choice(available)
-                        self.group_random_current[group_name] = chosen
+                if group.random_choices:
+                    self.group_random_current[group_name] = self.rng.choice(group.random_choices)
                 
-                interval = random.uniform(min_time, max_time)
+                interval = self.rng.uniform(group.random_min, group.random_max)
                 self.group_random_timers[group_name] = now + interval
             
-            if self.group_random_current.get(group_name):
-                return self.group_random_current.get(group_name)
+            current = self.group_random_current.get(group_name)
+            if current is not None:
+                return current
         
         # Обработка голосовых состояний
-        current_state = "silent"
-        if self.audio_level > self.thresholds['shout']:
-            current_state = "shout"
-        elif self.audio_level > self.thresholds['normal']:
-            current_state = "normal"
-        elif self.audio_level > self.thresholds['whisper']:
-            current_state = "whisper"
-        elif self.audio_level > self.thresholds['silent']:
-            current_state = "silent"
-        
-        if current_state in logic and self.active_states.get(current_state, True):
-            return logic.get(current_state)
-        
-        for state in reversed(self.state_order):
-            if state == current_state:
-                continue
-            if self.audio_level >= self.thresholds.get(state, 0) and self.active_states.get(state, True):
-                if state in logic:
-                    return logic.get(state)
+        voice = group.voice
+        for state in voice_candidates:
+            if voice[state] is not None:
+                return voice[state]
+        if voice[0] is not None:
+            return voice[0]
+        return ALL_CHILDREN
+
+    def _get_gif_frame(self, layer, now):
+        """Текущий кадр GIF-слоя: (изображение, индекс кадра, время смены кадра)"""
+        i = layer.index
+        last_update = self._gif_last_update[i]
+        if last_update is None:
+            self._gif_last_update[i] = now
+            return layer.frames[0], 0, now + layer.durations[0]
         
-        return logic.get("silent")
-
-    def _get_layer_image(self, layer_name):
-        """Получение изображения слоя"""
-        if layer_name in self._gif_frames:
-            now = time.time()
-            frames = self._gif_frames[layer_name]
-            frame_times = self._gif_frame_times[layer_name]
-            
-            if layer_name not in self._gif_last_update:
-                self._gif_last_update[layer_name] = now
-                self._gif_current_frame[layer_name] = 0
-            
-            current_frame = self._gif_current_frame[layer_name]
-            if now - self._gif_last_update[layer_name] > frame_times[current_frame]:
-                self._gif_current_frame[layer_name] = (current_frame + 1) % len(frames)
-                self._gif_last_update[layer_name] = now
-            
-            return frames[self._gif_current_frame[layer_name]]
-        elif layer_name in self._image_cache:
-            return self._image_cache[layer_name]
-        return None
+        current_frame = self._gif_current_frame[i]
+        if now - last_update > layer.durations[current_frame]:
+            current_frame = (current_frame + 1) % len(layer.frames)
+            self._gif_current_frame[i] = current_frame
+            self._gif_last_update[i] = last_update = now
+        return layer.frames[current_frame], current_frame, last_update + layer.durations[current_frame]
+
+    def _build_scene(self):
+        """Сбор описания сцены: сигнатура и список слоев для композиции.
+
+        Сигнатура - кортеж из выбранных слоев, индексов кадров GIF, позиций и
+        размеров после эффектов, а также состояния idle. Если она не изменилась,
+        кадр совпадает с предыдущим и его не нужно собирать заново.
+        """
+        now = self.clock.time()
+        plan = self.plan
+        scene = Scene()
+        scene.plan = plan
+        signature = []
+        base_key = [plan.version if plan else None]
+        if plan is not None:
+            effects = self.effects
+            level = self.audio_level
+            candidates = self._voice_candidates()
+            chosen = [self._choose_group_child(g, now, candidates) for g in plan.groups]
+            scene.choices = chosen
+
+            bounce_intensity = 0
+            if effects.get('bounce', False):
+                bounce_intensity = int(math.sin(now * 5) * min(10, level * 20))
+            shake = effects.get('shake', False)
+            if shake:
+                shake_intensity = min(1.0, level * 5)
+            pulse = effects.get('pulse', False)
+            if pulse:
+                # Масштаб округляется до ближайшей заранее посчитанной ступени
+                pulse_step = self.pulse.step_for(1.0 + math.sin(now * 5) * PULSE_AMPLITUDE * level)
+
+            width, height = self.width, self.height
+            draws = scene.draws
+            for layer in plan.draw_layers:
+                group = layer.group
+                if group >= 0:
+                    choice = chosen[group]
+                    if choice != ALL_CHILDREN and choice != layer.index:
+                        continue
+
+                if layer.frames is not None:
+                    image, frame_index, deadline = self._get_gif_frame(layer, now)
+                    if scene.gif_deadline is None or deadline < scene.gif_deadline:
+                        scene.gif_deadline = deadline
+                else:
+                    image, frame_index = layer.image, 0
+
+                if shake:
+                    offset_x = int((self.rng.random() - 0.5) * 10 * shake_intensity)
+                    offset_y = int((self.rng.random() - 0.5) * 10 * shake_intensity) + bounce_intensity
+                else:
+                    offset_x, offset_y = 0, bounce_intensity
+
+                if pulse:
+                    image = self.pulse.get(image, pulse_step)
+                    size = image.size
+                    px = (width - size[0]) // 2 + layer.x + offset_x
+                    py = (height - size[1]) // 2 + layer.y + offset_y
+                else:
+                    size = image.size
+                    px = layer.cx + offset_x
+                    py = layer.cy + offset_y
+                name = layer.name
+                signature.append((name, frame_index, px, py, size))
+                base_key.append((name, frame_index))
+                draws.append((name, image, px, py, size))
+
+            # Без дрожания и пульсации все слои сдвинуты одинаково, и кадр
+            # можно собрать из закэшированной базы одним копированием
+            if not shake and not pulse:
+                scene.base_key = tuple(base_key)
+                scene.offset_y = bounce_intensity
+
+        scene.idle = self._is_idle(now)
+        step = self._update_idle_fade(scene.idle, now)
+        scene.fade_step = step
+        scene.brightness = 1.0 - (1.0 - self.idle_brightness) * step / IDLE_FADE_STEPS
+        scene.model_version = plan.version if plan else self.model_version
+        signature.append(step)
+        signature.append(scene.model_version)
+        scene.signature = tuple(signature)
+        return scene
+
+    def _is_idle(self, now):
+        """Проверка, активен ли idle-режим"""
+        return self.idle_enabled and now - self.last_activity_time > self.idle_timeout
+
+    def _next_event_delay(self, scene, now):
+        """Время до ближайшего известного изменения сцены (None - сцена анимируется непрерывно).
+
+        Учитываются таймеры моргания, случайного эффекта, смена кадров GIF и
+        переход в idle-режим. Прыжки, дрожание и пульсация при звуке, а также
+        плавное затемнение меняют кадр на каждом тике.
+        """
+        effects = self.effects
+        if self.audio_level > 0 and any(effects.get(e, False) for e in ('bounce', 'shake', 'pulse')):
+            return None
+        target = 1.0 if scene.idle else 0.0
+        if self._idle_level != target and self.idle_fade > 0:
+            return None
+
+        deadlines = []
+        if scene.gif_deadline is not None:
+            deadlines.append(scene.gif_deadline)
+        plan = scene.plan
+        if plan is not None:
+            blink = effects.get('blink', True)
+            random_effect = effects.get('random_effect', False)
+            for group in plan.groups:
+                name = group.name
+                if blink and group.blink_freq > 0.001:
+                    deadlines.append(self.group_blink_timers.get(name, now))
+                    until = self.group_blink_until.get(name, 0.0)
+                    if until > now:
+                        deadlines.append(until)
+                if random_effect and group.random_effect:
+                    deadlines.append(self.group_random_timers.get(name, now))
+        if self.idle_enabled and not scene.idle:
+            deadlines.append(self.last_activity_time + self.idle_timeout)
+
+        delay = ADAPTIVE_MAX_SLEEP
+        for deadline in deadlines:
+            delay = min(delay, deadline - now + TIMER_EPSILON)
+        return max(0.0, delay)
+
+    def _update_idle_fade(self, idle, now):
+        """Продвижение плавного затемнения к цели, возвращает ступень затемнения.
+
+        Яркость квантуется ступенями, поэтому за переход собирается не больше
+        IDLE_FADE_STEPS кадров, а в установившемся состоянии сцена не меняется.
+        """
+        target = 1.0 if idle else 0.0
+        dt = now - self._idle_updated
+        self._idle_updated = now
+        if self.idle_fade <= 0:
+            self._idle_level = target
+        elif self._idle_level < target:
+            self._idle_level = min(target, self._idle_level + dt / self.idle_fade)
+        elif self._idle_level > target:
+            self._idle_level = max(target, self._idle_level - dt / self.idle_fade)
+        return int(round(self._idle_level * IDLE_FADE_STEPS))
+
+    def _compose_layers(self, draws, height, dy=0):
+        """Композиция слоев на прозрачном холсте"""
+        return self.compositor.compose(draws, self.width, height, dy)
+
+    def _compose_base(self, draws, offset_y):
+        """Композиция базового кадра (без сдвига) с полями под прыжки"""
+        margin = SCENE_CACHE_MARGIN
+        return self._compose_layers(draws, self.height + 2 * margin, margin - offset_y)
+
+    def _update_base(self, scene):
+        """Обновление базового кадра сцены.
+
+        Базовый кадр берется из кэша сцен, а при промахе собирается из
+        прошлого базового кадра перерисовкой только изменившихся областей.
+        Возвращает грязные области в координатах базового кадра или None,
+        если прошлого кадра той же модели нет.
+        """
+        margin = SCENE_CACHE_MARGIN
+        width, height = self.width, self.height + 2 * margin
+        dy = margin - scene.offset_y
+        draws = [(name, image, px, py + dy, size) for name, image, px, py, size in scene.draws]
+
+        rects = None
+        if self._base is not None and self._base_version == scene.model_version:
+            boxes = scene.plan.boxes if scene.plan is not None else None
+            rects = diff_draws(self._base_draws, draws, width, height, boxes)
+
+        cache = self.scene_cache
+        cached = cache.get(scene.base_key) if cache.enabled else None
+        if cached is not None:
+            self._base = cached
+            self._base_shared = True
+            self.compose_stats['cached'] += 1
+        elif rects is not None and sum(rect_area(r) for r in rects) <= width * height * DIRTY_FULL_RATIO:
+            if self._base_shared:
+                self._base = self.compositor.copy(self._base)
+                self._base_shared = False
+            for rect in rects:
+                self.compositor.compose_region(self._base, draws, rect)
+            self.compose_stats['partial'] += 1
+            self.compose_stats['dirty_pixels'] += sum(rect_area(r) for r in rects)
+        else:
+            self._base = self._compose_layers(draws, height)
+            self._base_shared = False
+            self.compose_stats['full'] += 1
+
+        if cached is None and cache.enabled:
+            # Кадр больше бюджета в кэш не попадает и остается нашим
+            self._base_shared = cache.put(scene.base_key, self._base)
+        self._base_draws = draws
+        self._base_version = scene.model_version
+        return rects
+
+    def _compose(self, scene):
+        """Композиция кадра сцены.
+
+        В scene.dirty записываются области кадра, изменившиеся с прошлой
+        композиции, для кодировщиков и транспортов с частичными обновлениями.
+        """
+        margin = SCENE_CACHE_MARGIN
+        dirty = None
+        dimmed = False
+        compositor = self.compositor
+        if compositor is not self._base_compositor:
+            # Холсты разных компоновщиков несовместимы
+            self._base = None
+            self._base_compositor = compositor
+            self.scene_cache.clear()
+        if scene.base_key is not None:
+            rects = self._update_base(scene)
+            top = margin - max(-margin, min(margin, scene.offset_y))
+            box = (0, top, self.width, top + self.height)
+            if scene.fade_step == IDLE_FADE_STEPS and self.scene_cache.enabled:
+                # Полностью затемненный базовый кадр считается один раз на сцену
+                img = compositor.crop(self._dimmed_base(scene), box)
+                dimmed = True
+            else:
+                img = compositor.crop(self._base, box)
+            composed = (scene.model_version, scene.fade_step, top)
+            # При сдвиге кадра прыжком изменяется весь кадр
+            if rects is not None and composed == self._last_composed:
+                dirty = [r for r in (clip_rect(offset_rect(rect, 0, -top), self.width, self.height)
+                                     for rect in rects) if r is not None]
+        else:
+            # Дрожание и пульсация сдвигают все слои, кадр собирается целиком
+            self._base = None
+            img = self._compose_layers(scene.draws, self.height)
+            self.compose_stats['full'] += 1
+            composed = None
+        self._last_composed = composed
+        scene.dirty = dirty
+
+        # ПРИМЕНЕНИЕ IDLE-РЕЖИМА К МОДЕЛИ
+        if scene.fade_step and not dimmed:
+            # Уменьшаем яркость изображения модели
+            img = compositor.brightness(img, scene.brightness)
+        return compositor.to_image(img)
+
+    def _dimmed_base(self, scene):
+        """Затемненный базовый кадр сцены из кэша сцен"""
+        key = scene.base_key + (('brightness', scene.brightness),)
+        dimmed = self.scene_cache.get(key)
+        if dimmed is None:
+            dimmed = self.compositor.brightness(self._base, scene.brightness)
+            self.scene_cache.put(key, dimmed)
+        return dimmed
+
+    def set_compositor(self, compositor):
+        """Смена компоновщика слоев (применяется со следующего кадра)"""
+        if self.plan is not None:
+            compositor.set_boxes(self.plan.boxes)
+        self.compositor = compositor
+        self._last_signature = None
+
+    def render_frame(self, compose=True):
+        """Один кадр вне цикла рендеринга, по текущему времени часов.
+
+        Для пакетного рендера с виртуальными часами: сцена собирается так
+        же, как в цикле, при compose=False только продвигаются таймеры и
+        анимации, а кадр не собирается (возвращается None).
+        """
+        self._install_pending_plan()
+        scene = self._build_scene()
+        if not compose:
+            return None
+        return self._compose(scene)
+
+    def get_frame_stats(self):
+        """Время сборки и кодирования кадров (p50/p95/p99) и пропущенные кадры"""
+        return self.scheduler.stats()
+
+    def get_latency_stats(self):
+        """Задержка от блока звука до отправки кадра по этапам"""
+        return self.latency.stats()
+
+    def get_compose_stats(self):
+        """Статистика композиции: полные, частичные и взятые из кэша кадры"""
+        return dict(self.compose_stats)
+
+    def set_scene_cache(self, budget_mb, warmup=False):
+        """Настройка кэша готовых кадров"""
+        self.scene_cache.set_budget(budget_mb)
+        self.scene_cache_warmup = warmup
+        if warmup and self.plan is not None:
+            self._start_scene_cache_warmup()
+
+    def get_scene_cache_stats(self):
+        """Статистика кэша готовых кадров"""
+        return self.scene_cache.stats()
+
+    def _start_scene_cache_warmup(self):
+        """Запуск прогрева кэша в фоновом потоке"""
+        if not self.scene_cache.enabled:
+            return
+        thread = threading.Thread(target=self._warmup_scene_cache, args=(self.plan,), daemon=True)
+        thread.start()
+
+    def _warmup_scene_cache(self, plan):
+        """Предварительная композиция всех комбинаций состояний групп"""
+        layers = plan.draw_layers
+        options = []
+        for group in plan.groups:
+            children = [l for l in layers if l.group == group.index]
+            if children:
+                options.append(children)
+        frame_size = self.width * (self.height + 2 * SCENE_CACHE_MARGIN) * 4
+        compositor = self.compositor
+
+        for combination in itertools.product(*options):
+            chosen = set(l.index for l in combination)
+            selected = [l for l in layers if l.group < 0 or l.index in chosen]
+            frame_options = []
+            for layer in selected:
+                if layer.frames is not None:
+                    frame_options.append(list(enumerate(layer.frames)))
+                else:
+                    frame_options.append([(0, layer.image)])
+
+            for frames in itertools.product(*frame_options):
+                if (plan is not self.plan or compositor is not self.compositor
+                        or not self.scene_cache.has_room(frame_size)):
+                    return
+                key = [plan.version]
+                draws = []
+                for layer, (frame_index, image) in zip(selected, frames):
+                    key.append((layer.name, frame_index))
+                    draws.append((layer.name, image, layer.cx, layer.cy, image.size))
+                key = tuple(key)
+                if key not in self.scene_cache:
+                    self.scene_cache.put(key, self._compose_base(draws, 0))
+
+    def add_stream_client(self, name="", patches=False):
+        """Регистрация потребителя кадров (например, клиента /stream)"""
+        client = self.broadcaster.register(name, patches)
+        self._wake.set()
+        return client
+
+    def remove_stream_client(self, client):
+        """Отключение потребителя кадров"""
+        self.broadcaster.unregister(client)
+
+    @property
+    def render_thread(self):
+        """Поток цикла рендеринга (None, если рендерер не запущен)"""
+        return self._thread if self._running else None
+
+    @property
+    def state_clients(self):
+        """Количество клиентов состояния сцены"""
+        with self._scene_cond:
+            return self._state_clients
+
+    @property
+    def stream_clients(self):
+        """Количество подключенных потребителей кадров"""
+        return self.broadcaster.client_count()
+
+    def get_snapshot(self, timeout=1.0):
+        """Получение актуального кадра даже без подключенных клиентов"""
+        if not self._running:
+            return self.get_frame_bytes()
+        with self._frame_ready:
+            self._snapshot_pending = True
+            self._wake.set()
+            self._frame_ready.wait_for(lambda: not self._snapshot_pending, timeout)
+            return self._frame_bytes
+
+    def add_state_client(self):
+        """Регистрация клиента, которому нужно только состояние сцены"""
+        with self._scene_cond:
+            self._state_clients += 1
+        self._wake.set()
+
+    def remove_state_client(self):
+        """Отключение клиента состояния сцены"""
+        with self._scene_cond:
+            self._state_clients = max(0, self._state_clients - 1)
+
+    def get_scene_state(self):
+        """Последнее состояние сцены: (номер, словарь состояния)"""
+        with self._scene_cond:
+            return self._scene_seq, self._scene_state
+
+    def wait_scene_state(self, last_seq, timeout=1.0):
+        """Ожидание состояния сцены новее last_seq (None по таймауту)"""
+        with self._scene_cond:
+            self._scene_cond.wait_for(lambda: self._scene_state is not None
+                                      and self._scene_seq != last_seq, timeout)
+            if self._scene_state is None or self._scene_seq == last_seq:
+                return None
+            return self._scene_seq, self._scene_state
+
+    @staticmethod
+    def _group_choice_names(scene):
+        """Имена выбранных слоев групп сцены"""
+        plan = scene.plan
+        if plan is None:
+            return {}
+        names = {}
+        for group, choice in zip(plan.groups, scene.choices):
+            if choice != ALL_CHILDREN:
+                names[group.name] = plan.layers[choice].name if choice >= 0 else None
+        return names
+
+    def _publish_scene(self, scene):
+        """Публикация состояния сцены: выбранные слои групп и позиции слоев"""
+        state = {
+            'groups': self._group_choice_names(scene),
+            # [имя слоя, кадр GIF, x, y, ширина, высота] с учетом эффектов
+            'layers': [[name, frame, px, py, size[0], size[1]]
+                       for name, frame, px, py, size in scene.signature[:-2]],
+            'idle': scene.idle,
+            'idle_brightness': self.idle_brightness,
+            # Текущая яркость с учетом плавного перехода
+            'brightness': scene.brightness,
+            'model_version': scene.model_version,
+        }
+        with self._scene_cond:
+            self._scene_seq += 1
+            state['seq'] = self._scene_seq
+            self._scene_state = state
+            self._scene_cond.notify_all()
+            return self._scene_seq
 
     def _loop(self):
         """Основной цикл рендеринга"""
-        frame_time = 1.0 / self.fps
+        scheduler = self.scheduler
         while self._running:
-            start = time.time()
-            img = Image.new("RGBA", (self.width, self.height), (0,0,0,0))
-            if self.model and self.model_dir:
-                group_choices = {}
-                for group in self.model.get("groups", []):
-                    chosen = self._choose_group_child(group)
-                    if chosen:
-                        group_choices[group['name']] = chosen
-                
-                layers_by_name = {l.get("name"): l for l in self.model.get("layers", [])}
-                for layer in self.model.get("layers", []):
-                    name = layer.get("name")
-                    group_name = layer.get("group")
-                    
-                    if group_name and group_name in group_choices:
-                        if name != group_choices[group_name]:
-                            continue
-                    
-                    if not layer.get("visible", True):
-                        continue
-                    
-                    image = self._get_layer_image(name)
-                    if not image:
-                        continue
-                    
-                    orig_image = image.copy()
-                    
-                    bounce_intensity = 0
-                    if self.effects.get('bounce', False):
-                        bounce_intensity = int(math.sin(time.time() * 5) * min(10, self.audio_level * 20))
-                    
-                    if self.effects.get('shake', False):
-                        shake_intensity = min(1.0, self.audio_level * 5)
-                        offset_x = int((random.random() - 0.5) * 10 * shake_intensity)
-                        offset_y = int((random.random() - 0.5) * 10 * shake_intensity) + bounce_intensity
-                    else:
-                        offset_x, offset_y = 0, bounce_intensity
-                        
-                    if self.effects.get('pulse', False):
-                        pulse_scale = 1.0 + (math.sin(time.time() * 5) * 0.1 * self.audio_level)
-                        new_size = (int(image.width * pulse_scale), int(image.height * pulse_scale))
-                        image = image.resize(new_size, Image.LANCZOS)
-                    
-                    px = (self.width - image.width) // 2 + int(layer.get("x", 0)) + offset_x
-                    py = (self.height - image.height) // 2 + int(layer.get("y", 0)) + offset_y
-                    try:
-                        img.alpha_composite(image, (px, py))
-                    except Exception as e:
-                        print(f"Ошибка композиции слоя {name}: {e}")
-                    
-                    image = orig_image
-            
-            # ПРИМЕНЕНИЕ IDLE-РЕЖИМА К МОДЕЛИ
-            if self.idle_enabled:
-                current_time = time.time()
-                if current_time - self.last_activity_time > self.idle_timeout:
-                    # Уменьшаем яркость изображения модели
-                    enhancer = ImageEnhance.Brightness(img)
-                    img = enhancer.enhance(self.idle_brightness)
-
-            with io.BytesIO() as buf:
-                img.save(buf, format="PNG")
-                data = buf.getvalue()
+            start = scheduler.begin()
+            # Новая модель подменяется только между кадрами
+            self._install_pending_plan()
+            scene = self._build_scene()
+            signature = scene.signature
+
+            scene_seq = None
+            if signature != self._scene_signature:
+                scene_seq = self._publish_scene(scene)
+                self._scene_signature = signature
+            self.latency.scene_built(start, scene_seq)
+
+            clients = self.stream_clients
+            with self._scene_cond:
+                watchers = clients + self._state_clients
             with self._lock:
-                self._frame_bytes = data
-            
-            elapsed = time.time() - start
-            to_sleep = frame_time - elapsed
-            if to_sleep > 0:
-                time.sleep(to_sleep)
\ No newline at end of file
+                demand = clients > 0 or self._snapshot_pending
+
+            # Кадр кодируется только при изменении сцены и только если он кому-то нужен
+            if demand and (signature != self._last_signature or self._frame_bytes is None):
+                img = self._compose(scene)
+                composed = time.perf_counter()
+                scheduler.render.add(composed - start)
+                data = self.encoder.encode(img)
+                with self._lock:
+                    self._frame_bytes = data
+                    self._frame_mimetype = mimetype = self.encoder.mimetype
+                    self._frame_seq += 1
+                    seq = self._frame_seq
+                self._last_signature = signature
+                # Изменившиеся области кодируются один раз для всех клиентов с patches
+                patches = None
+                if scene.dirty is not None and self.broadcaster.patch_client_count():
+                    patches = [(rect, self.encoder.encode_region(img, rect)) for rect in scene.dirty]
+                scheduler.encode.add(time.perf_counter() - composed)
+                self.latency.frame_encoded(seq)
+                self.broadcaster.publish(seq, data, mimetype, patches)
+                self.frame_rate.tick()
+                self.frame_sizes.add(len(data))
+
+            if demand:
+                with self._frame_ready:
+                    self._snapshot_pending = False
+                    self._frame_ready.notify_all()
+
+            # Без потребителей рендерер переходит на редкие тики, в адаптивном
+            # режиме спит до ближайшего события сцены, но не чаще fps
+            delay = self._next_event_delay(scene, self.clock.time()) if self.adaptive and watchers else None
+            if delay is not None:
+                scheduler.wait_until(delay, 1.0 / self.fps, self._wake)
+            else:
+                scheduler.wait(1.0 / (self.fps if watchers else self.idle_fps), self._wake)
@@ -0,0 +1,104 @@
+import time, threading
+import numpy as np
+
+class AudioRingBuffer:
+    """Кольцевой буфер отсчетов звука без блокировок.
+
+    Один писатель (callback PortAudio) и один читатель (поток обработки).
+    Память выделяется один раз; каждый блок записывается дважды - в
+    основную половину массива и в зеркальную, поэтому любое окно длиной
+    до capacity - непрерывный срез и читается без копирования. Позиции -
+    монотонные счетчики отсчетов; писатель сдвигает свою позицию только
+    после записи данных и затем будит читателя через Event - сами данные
+    идут мимо блокировок.
+
+    overflows - сколько раз читатель отстал больше чем на capacity
+    (dropped - потерянные отсчеты), underruns - сколько раз читатель не
+    дождался новых данных.
+    """
+    def __init__(self, capacity=8192, dtype=np.float32):
+        self.capacity = int(capacity)
+        self._buffer = np.zeros(self.capacity * 2, dtype=dtype)
+        self._written = 0
+        self._read = 0
+        self.written_at = None  # time.perf_counter() последней записи
+        self.overflows = 0
+        self.dropped = 0
+        self.underruns = 0
+        self._ready = threading.Event()
+
+    def write(self, block, timestamp=None):
+        """Запись блока (одномерный массив или первый канал двумерного)"""
+        if block.ndim > 1:
+            block = block[:, 0]
+        n = len(block)
+        if n > self.capacity:
+            block = block[-self.capacity:]
+            n = self.capacity
+        cap = self.capacity
+        pos = self._written % cap
+        buffer = self._buffer
+        # Основная запись может зайти во вторую половину - это зеркало начала
+        buffer[pos:pos + n] = block
+        if pos + n <= cap:
+            buffer[pos + cap:pos + n + cap] = block
+        else:
+            buffer[pos + cap:] = block[:cap - pos]
+            buffer[:pos + n - cap] = block[cap - pos:]
+        self.written_at = timestamp if timestamp is not None else time.perf_counter()
+        self._written += n
+        self._ready.set()
+
+    def available(self):
+        """Количество непрочитанных отсчетов"""
+        return self._written - self._read
+
+    def wait(self, timeout):
+        """Ожидание новых отсчетов: поток спит, пока писатель не разбудит.
+
+        Возвращает False (и учитывает underrun), если данных нет за timeout.
+        """
+        deadline = time.perf_counter() + timeout
+        while self._written == self._read:
+            # Сброс до повторной проверки: запись после нее снова поднимет флаг
+            self._ready.clear()
+            if self._written != self._read:
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 or not self._ready.wait(remaining):
+                if self._written != self._read:
+                    break
+                self.underruns += 1
+                return False
+        return True
+
+    def read_latest(self, n):
+        """Последние n отсчетов без копирования; все данные считаются прочитанными.
+
+        Срез действителен до следующей записи по этому месту буфера.
+        """
+        written = self._written
+        unread = written - self._read
+        if unread > self.capacity:
+            self.overflows += 1
+            self.dropped += unread - self.capacity
+        self._read = written
+        n = min(int(n), self.capacity, written)
+        start = (written - n) % self.capacity
+        return self._buffer[start:start + n]
+
+    def reset(self):
+        self._read = self._written = 0
+        self.written_at = None
+        self.overflows = self.dropped = self.underruns = 0
+        self._ready.clear()
+
+    def stats(self):
+        return {
+            'capacity': self.capacity,
+            'written': self._written,
+            'available': self.available(),
+            'overflows': self.overflows,
+            'dropped': self.dropped,
+            'underruns': self.underruns,
+        }
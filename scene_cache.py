@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+class SceneCache:
+    """LRU-кэш готовых базовых кадров модели.
+
+    Ключ - кортеж выбранных слоев (имя слоя, индекс кадра GIF). Размер кэша
+    ограничен бюджетом памяти в мегабайтах, изображения считаются как RGBA,
+    холсты-массивы - по фактическому размеру.
+    """
+    def __init__(self, budget_mb=64):
+        self._lock = threading.Lock()
+        self._frames = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.budget_bytes = 0
+        self.set_budget(budget_mb)
+
+    @staticmethod
+    def _image_size(image):
+        nbytes = getattr(image, "nbytes", None)
+        if nbytes is not None:
+            return nbytes
+        return image.width * image.height * 4
+
+    @property
+    def enabled(self):
+        return self.budget_bytes > 0
+
+    def set_budget(self, budget_mb):
+        """Установка бюджета памяти (0 - кэш отключен)"""
+        with self._lock:
+            self.budget_bytes = max(0, int(float(budget_mb) * 1024 * 1024))
+            self._evict()
+
+    def get(self, key):
+        """Получение кадра по ключу (None при промахе)"""
+        with self._lock:
+            image = self._frames.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        """Добавление кадра в кэш"""
+        size = self._image_size(image)
+        with self._lock:
+            if size > self.budget_bytes:
+                return False
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._size -= self._image_size(old)
+            self._frames[key] = image
+            self._size += size
+            self._evict()
+            return True
+
+    def has_room(self, image_size):
+        """Поместится ли кадр без вытеснения других"""
+        with self._lock:
+            return self._size + image_size <= self.budget_bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    def _evict(self):
+        while self._frames and self._size > self.budget_bytes:
+            _, image = self._frames.popitem(last=False)
+            self._size -= self._image_size(image)
+
+    def clear(self):
+        """Очистка кэша (счетчики сохраняются)"""
+        with self._lock:
+            self._frames.clear()
+            self._size = 0
+
+    def stats(self):
+        """Статистика кэша"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._frames),
+                'size_mb': self._size / (1024 * 1024),
+                'budget_mb': self.budget_bytes / (1024 * 1024),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,160 @@
+import threading, time
+from collections import deque
+
+class FrameTimeHistogram:
+    """Скользящее окно длительностей с перцентилями.
+
+    Значения хранятся в секундах, а stats отдает их умноженными на scale
+    (по умолчанию - в миллисекундах; scale=1 - для размеров в байтах).
+    """
+    def __init__(self, window=600, scale=1000.0):
+        self._lock = threading.Lock()
+        self.scale = scale
+        self._samples = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+
+    def stats(self):
+        """Перцентили p50/p95/p99, среднее и максимум по окну"""
+        with self._lock:
+            samples = sorted(self._samples)
+            count = self.count
+        if not samples:
+            return {'count': count, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'avg': 0.0, 'max': 0.0}
+        scale = self.scale
+
+        def percentile(p):
+            return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * scale
+
+        return {
+            'count': count,
+            'p50': percentile(50),
+            'p95': percentile(95),
+            'p99': percentile(99),
+            'avg': sum(samples) / len(samples) * scale,
+            'max': samples[-1] * scale,
+        }
+
+class RateMeter:
+    """Частота событий за последние window секунд.
+
+    tick() - одно добавление в deque без блокировок, поэтому его можно
+    вызывать из callback звуковой карты.
+    """
+    def __init__(self, window=2.0):
+        self.window = window
+        self._times = deque(maxlen=4096)
+        self.count = 0
+
+    def tick(self):
+        self._times.append(time.perf_counter())
+        self.count += 1
+
+    def rate(self):
+        """События в секунду"""
+        now = time.perf_counter()
+        recent = [t for t in self._times if now - t <= self.window]
+        if len(recent) < 2:
+            return 0.0
+        # Интервалы между событиями окна; после последнего события время
+        # тоже идет, поэтому частота падает, когда события прекращаются
+        return (len(recent) - 1) / (now - recent[0])
+
+class FrameScheduler:
+    """Планировщик тиков рендерера с абсолютными дедлайнами.
+
+    Дедлайны отсчитываются по time.perf_counter от предыдущего дедлайна, а
+    не от конца работы, поэтому ошибки сна не накапливаются, а переводы
+    системных часов не влияют на темп. Если тик не уложился в период,
+    политика "skip" пропускает просроченные дедлайны (они учитываются как
+    пропущенные кадры), а "catchup" выполняет следующие тики без паузы,
+    пока не догонит сетку.
+    """
+    SKIP_POLICIES = ("skip", "catchup")
+    MAX_CATCHUP = 1.0  # максимальное отставание в секундах для политики "catchup"
+
+    def __init__(self, skip_policy="skip", window=600):
+        self.skip_policy = skip_policy if skip_policy in self.SKIP_POLICIES else "skip"
+        self._deadline = None
+        self._tick_start = 0.0
+        self.period = 0.0
+        self.ticks = 0
+        self.missed = 0
+        self.render = FrameTimeHistogram(window)    # сборка сцены и композиция кадра
+        self.encode = FrameTimeHistogram(window)    # кодирование кадра
+        self.tick = FrameTimeHistogram(window)      # вся работа тика
+        self.lateness = FrameTimeHistogram(window)  # опоздание начала тика от дедлайна
+
+    def set_skip_policy(self, policy):
+        if policy not in self.SKIP_POLICIES:
+            print(f"Неизвестная политика пропуска кадров: {policy}")
+            return
+        self.skip_policy = policy
+
+    def begin(self):
+        """Начало тика"""
+        now = time.perf_counter()
+        if self._deadline is not None:
+            self.lateness.add(max(0.0, now - self._deadline))
+        self._tick_start = now
+        self.ticks += 1
+        return now
+
+    def wait(self, period, wake):
+        """Ожидание дедлайна следующего тика.
+
+        wake - threading.Event для внеочередного тика; после него сетка
+        дедлайнов начинается от момента пробуждения.
+        """
+        now = time.perf_counter()
+        self.tick.add(now - self._tick_start)
+        self.period = period
+        deadline = (self._deadline if self._deadline is not None else self._tick_start) + period
+        # Опоздание меньше периода - следующий тик начинается сразу
+        behind = int((now - deadline) / period) if now > deadline else 0
+        if behind:
+            if self.skip_policy == "skip":
+                self.missed += behind
+                deadline += behind * period
+            elif now - deadline > self.MAX_CATCHUP:
+                # После долгой остановки (например, сна системы) не догоняем
+                deadline = now
+        self._deadline = deadline
+        self._sleep(deadline - now, wake)
+
+    def wait_until(self, delay, min_period, wake):
+        """Ожидание ближайшего события сцены через delay секунд (адаптивный режим).
+
+        Тики идут не чаще min_period; событие wake будит рендерер сразу.
+        """
+        now = time.perf_counter()
+        self.tick.add(now - self._tick_start)
+        self.period = 0.0
+        deadline = max(now + delay, self._tick_start + min_period)
+        self._deadline = deadline
+        self._sleep(deadline - now, wake)
+
+    def _sleep(self, timeout, wake):
+        woke = False
+        if timeout > 0:
+            woke = wake.wait(timeout)
+        wake.clear()
+        if woke:
+            self._deadline = time.perf_counter()
+
+    def stats(self):
+        """Статистика времени кадров (target_fps = 0 в адаптивном режиме)"""
+        return {
+            'target_fps': 1.0 / self.period if self.period else 0.0,
+            'skip_policy': self.skip_policy,
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'render_ms': self.render.stats(),
+            'encode_ms': self.encode.stats(),
+            'tick_ms': self.tick.stats(),
+            'lateness_ms': self.lateness.stats(),
+        }
@@ -0,0 +1,24 @@
+import os, sys, shutil
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import layer_cache
+from layer_cache import LayerCache
+
+SLOT1 = os.path.join(ROOT, "models", "slot1")
+
+@pytest.fixture(autouse=True)
+def temp_layer_cache(tmp_path, monkeypatch):
+    """Кэш слоев во временной папке, а не в cache/layers рабочего дерева"""
+    cache = LayerCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(layer_cache, "_default_cache", cache)
+    return cache
+
+@pytest.fixture
+def slot1_dir(tmp_path):
+    """Копия models/slot1 без атласа: загрузка не пишет в папку модели"""
+    model_dir = tmp_path / "slot1"
+    shutil.copytree(SLOT1, model_dir, ignore=shutil.ignore_patterns(".atlas"))
+    return str(model_dir)
@@ -0,0 +1,31 @@
+import random
+import numpy as np
+from PIL import Image
+
+WIDTH = HEIGHT = 700
+
+def make_layer(rng, size, content):
+    """Слой со случайным цветом и альфа-градиентом в области content.
+
+    Как и в обычных моделях, рисунок занимает часть прозрачного холста слоя.
+    """
+    w, h = size
+    cw, ch = int(w * content), int(h * content)
+    cx, cy = (w - cw) // 2, (h - ch) // 2
+    array = np.zeros((h, w, 4), dtype=np.uint8)
+    array[..., :3] = rng.integers(0, 256, 3, dtype=np.uint8)
+    alpha = np.linspace(0, 255, cw, dtype=np.float32)[None, :] * np.linspace(0.2, 1, ch)[:, None]
+    array[cy:cy + ch, cx:cx + cw, 3] = alpha.astype(np.uint8)
+    array[cy + ch // 4:cy + ch // 2, cx + cw // 4:cx + cw // 2, 3] = 255
+    return Image.fromarray(array)
+
+def make_draws(count, content, seed=1):
+    rng = np.random.default_rng(seed)
+    rand = random.Random(seed)
+    draws = []
+    for i in range(count):
+        size = (rand.randint(40, 450), rand.randint(40, 450))
+        px = rand.randint(-50, WIDTH - size[0] + 50)
+        py = rand.randint(-50, HEIGHT - size[1] + 50)
+        draws.append((f"layer{i}", make_layer(rng, size, content), px, py, size))
+    return draws
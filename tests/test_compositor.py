@@ -0,0 +1,109 @@
+import os, json
+import numpy as np
+import pytest
+
+from compositor import PillowCompositor, NumpyCompositor
+from dirty_rects import alpha_bbox, diff_draws
+from clock import VirtualClock
+from renderer import Renderer
+from tests.scenes import WIDTH, HEIGHT, make_draws
+
+# Допустимое отклонение премультиплицированного значения канала (округление
+# в Pillow и NumPy различается и накапливается по слоям)
+TOLERANCE = 4
+# Допустимое среднее отклонение при пульсации (другой фильтр масштабирования)
+PULSE_MEAN_TOLERANCE = 8.0
+RECTS = [(0, 0, 350, 350), (200, 300, 700, 520), (600, 0, 700, 700)]
+
+def premultiplied(image):
+    # Сравнение в премультиплицированных значениях: ошибки округления не
+    # усиливаются почти прозрачными пикселями
+    return np.asarray(image.convert("RGBa"), dtype=np.int16)
+
+def max_diff(a, b):
+    return int(np.abs(premultiplied(a) - premultiplied(b)).max())
+
+def mean_diff(a, b):
+    return float(np.abs(premultiplied(a) - premultiplied(b)).mean())
+
+@pytest.fixture(scope="module")
+def draws():
+    return make_draws(12, 0.5)
+
+@pytest.fixture
+def pillow():
+    return PillowCompositor()
+
+@pytest.fixture
+def numpy_comp():
+    return NumpyCompositor()
+
+def test_compose_matches_pillow(draws, pillow, numpy_comp):
+    reference = pillow.compose(draws, WIDTH, HEIGHT)
+    canvas = numpy_comp.compose(draws, WIDTH, HEIGHT)
+    assert max_diff(reference, numpy_comp.to_image(canvas)) <= TOLERANCE
+
+def test_numpy_regions_match_full_compose(draws, numpy_comp):
+    canvas = numpy_comp.compose(draws, WIDTH, HEIGHT)
+    regions = numpy_comp.copy(canvas)
+    for x0, y0, x1, y1 in RECTS:
+        regions[y0:y1, x0:x1] = 0
+    for rect in RECTS:
+        numpy_comp.compose_region(regions, draws, rect)
+    assert np.array_equal(regions, canvas)
+
+def test_pillow_regions_match_full_compose(draws, pillow):
+    reference = pillow.compose(draws, WIDTH, HEIGHT)
+    regions = reference.copy()
+    for rect in RECTS:
+        pillow.compose_region(regions, draws, rect)
+    assert max_diff(reference, regions) == 0
+
+def test_pillow_boxes_match_full_layers(draws, pillow):
+    reference = pillow.compose(draws, WIDTH, HEIGHT)
+    boxed = PillowCompositor()
+    boxed.set_boxes({id(image): alpha_bbox(image) for _, image, _, _, _ in draws})
+    assert max_diff(reference, boxed.compose(draws, WIDTH, HEIGHT)) == 0
+    regions = reference.copy()
+    for rect in RECTS:
+        boxed.compose_region(regions, draws, rect)
+    assert max_diff(reference, regions) == 0
+
+def test_diff_draws_limited_to_opaque_bbox(draws):
+    name, image, px, py, size = draws[0]
+    moved = [(name, image, px + 10, py, size)] + draws[1:]
+    boxes = {id(image): alpha_bbox(image)}
+    x0, y0, x1, y1 = alpha_bbox(image)
+    full = diff_draws(draws, moved, WIDTH, HEIGHT)
+    boxed = diff_draws(draws, moved, WIDTH, HEIGHT, boxes)
+    area = lambda rects: sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects)
+    assert 0 < area(boxed) < area(full)
+    assert all(r[1] >= max(py + y0, 0) and r[3] <= min(py + y1, HEIGHT) for r in boxed)
+
+def test_brightness_matches_pillow(draws, pillow, numpy_comp):
+    reference = pillow.brightness(pillow.compose(draws, WIDTH, HEIGHT), 0.5)
+    canvas = numpy_comp.brightness(numpy_comp.compose(draws, WIDTH, HEIGHT), 0.5)
+    assert max_diff(reference, numpy_comp.to_image(canvas)) <= TOLERANCE
+
+def test_scaled_layers_close_to_pillow(draws, pillow, numpy_comp):
+    pulse = [(name, image, px, py, (int(size[0] * 1.07), int(size[1] * 1.07)))
+             for name, image, px, py, size in draws]
+    reference = pillow.compose(pulse, WIDTH, HEIGHT)
+    image = numpy_comp.to_image(numpy_comp.compose(pulse, WIDTH, HEIGHT))
+    assert mean_diff(reference, image) <= PULSE_MEAN_TOLERANCE
+
+def render_slot1(model_dir, compositor, effects, level):
+    renderer = Renderer(clock=VirtualClock(100.0), seed=1)
+    renderer.set_compositor(compositor)
+    renderer.set_effects(effects)
+    with open(os.path.join(model_dir, "model.json"), "r", encoding="utf-8") as f:
+        renderer.load_model(json.load(f), model_dir, wait=True)
+    renderer.set_audio_level(level)
+    return renderer.render_frame()
+
+@pytest.mark.parametrize("level", [0.0, 0.2, 0.5, 1.0])
+@pytest.mark.parametrize("effects", [{"blink": False}, {"blink": False, "shake": True, "bounce": True}])
+def test_slot1_frames_match_pillow(slot1_dir, effects, level):
+    reference = render_slot1(slot1_dir, PillowCompositor(), effects, level)
+    image = render_slot1(slot1_dir, NumpyCompositor(), effects, level)
+    assert max_diff(reference, image) <= TOLERANCE
@@ -0,0 +1,49 @@
+import io
+import numpy as np
+import pytest
+from PIL import Image
+
+from encoders import ENCODERS, create_encoder, qoi_encode
+from tests.scenes import make_draws
+from compositor import PillowCompositor
+
+def decoded(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return np.asarray(image.convert("RGBA"))
+
+def scene():
+    return PillowCompositor().compose(make_draws(12, 0.5), 700, 700)
+
+@pytest.mark.parametrize("image", [
+    Image.new("RGBA", (700, 700)),
+    # Совпадает с начальным пикселем декодера: весь кадр - серии RUN
+    Image.new("RGBA", (130, 1), (0, 0, 0, 255)),
+    Image.new("RGB", (31, 17), (9, 200, 3)),
+    Image.fromarray(np.random.default_rng(1).integers(0, 256, (37, 53, 4), dtype=np.uint8)),
+    # Плавные переходы кодируются операциями DIFF и LUMA
+    Image.fromarray((np.cumsum(np.random.default_rng(2).integers(-40, 41, (64, 96, 4)), axis=1) % 256)
+                    .astype(np.uint8)),
+], ids=["transparent", "start-pixel", "rgb", "noise", "gradients"])
+def test_qoi_round_trip(image):
+    assert np.array_equal(decoded(qoi_encode(image)), np.asarray(image.convert("RGBA")))
+
+def test_qoi_scene_and_region():
+    encoder = create_encoder({"format": "qoi"})
+    frame = scene()
+    assert np.array_equal(decoded(encoder.encode(frame)), np.asarray(frame))
+    rect = (100, 150, 333, 401)
+    assert np.array_equal(decoded(encoder.encode_region(frame, rect)), np.asarray(frame.crop(rect)))
+
+@pytest.mark.parametrize("name", [name for name in ENCODERS if name != "raw"])
+def test_lossless_formats_decode(name):
+    config = {"format": name}
+    if name == "webp":
+        config["lossless"] = True
+    encoder = create_encoder(config)
+    assert encoder.name == name
+    frame = scene()
+    if name == "jpeg":
+        assert decoded(encoder.encode(frame)).shape == (700, 700, 4)
+    else:
+        assert np.array_equal(decoded(encoder.encode(frame)), np.asarray(frame))
@@ -0,0 +1,69 @@
+import time, threading
+import numpy as np
+
+from ringbuffer import AudioRingBuffer
+from audio_sources import SyntheticBlockSource
+from audio import AudioProcessor, BLOCKSIZE, SAMPLERATE
+
+def run_processor(seconds, realtime):
+    levels = []
+
+    def factory(**params):
+        # Огибающая 2 Гц: за полсекунды уровень проходит от тишины до максимума
+        return SyntheticBlockSource(realtime=realtime, envelope_hz=2.0, **params)
+
+    processor = AudioProcessor(callback=levels.append, stream_factory=factory)
+    processor.start()
+    time.sleep(seconds)
+    processor.stop()
+    return levels, processor.get_stats()['ring']
+
+def test_window_across_wrap_point():
+    # Окна на стыке кольца совпадают с последними записанными отсчетами
+    ring = AudioRingBuffer(1000)
+    written = np.arange(0, 3700, dtype=np.float32)
+    for start in range(0, len(written), 300):
+        ring.write(written[start:start + 300])
+        end = min(start + 300, len(written))
+        assert np.array_equal(ring.read_latest(700), written[max(0, end - 700):end])
+
+def test_window_without_copy():
+    ring = AudioRingBuffer(1000)
+    ring.write(np.ones(800, dtype=np.float32))
+    assert np.shares_memory(ring.read_latest(500), ring._buffer)
+
+def test_overflow_counted():
+    ring = AudioRingBuffer(1000)
+    for _ in range(3):
+        ring.write(np.zeros(600, dtype=np.float32))
+    ring.read_latest(100)
+    assert ring.overflows == 1
+    assert ring.dropped == 800
+
+def test_underrun_counted_on_timeout():
+    ring = AudioRingBuffer(1000)
+    assert not ring.wait(0.01)
+    assert ring.underruns == 1
+
+def test_wait_wakes_on_write():
+    ring = AudioRingBuffer(1000)
+    writer = threading.Timer(0.05, ring.write, args=(np.zeros(100, dtype=np.float32),))
+    writer.start()
+    start = time.perf_counter()
+    assert ring.wait(2.0)
+    assert time.perf_counter() - start < 1.0
+    assert ring.underruns == 0
+    writer.join()
+
+def test_processor_realtime_without_overflows():
+    seconds = 0.5
+    levels, stats = run_processor(seconds, realtime=True)
+    expected = seconds * SAMPLERATE / BLOCKSIZE
+    assert len(levels) > expected * 0.8
+    assert stats['overflows'] == 0
+    assert max(levels) > 0.5 and min(levels) == 0.0
+
+def test_processor_without_pacing_counts_overflows():
+    _, stats = run_processor(0.2, realtime=False)
+    assert stats['overflows'] > 0
+    assert stats['dropped'] > 0
@@ -1,23 +1,111 @@
-from threading import Thread
-from flask import Flask, Response, send_from_directory
-import time
+from threading import Thread, Lock
+from flask import Flask, Response, send_from_directory, jsonify, request
+from flask_sock import Sock
+import json
+import io
 import logging
 import os
 import sys
+from metrics import collect_stats, prometheus_text
+from profiler import sample_thread, summarize, collapsed
+
+# Наибольшая длительность /debug/profile в секундах
+PROFILE_MAX_SECONDS = 60
 
 # Отключение логирования Flask
 log = logging.getLogger('werkzeug')
 log.setLevel(logging.ERROR)
 
+# Страница, которая собирает кадр на canvas из слоев модели.
+# Изображения слоев загружаются один раз, по WebSocket приходит только состояние сцены.
+CLIENT_PAGE = """<html>
+<head>
+    <title>WebPNGTuber</title>
+    <link rel="icon" href="/favicon.ico" type="image/x-icon">
+    <style>
+        body { margin: 0; background: transparent; overflow: hidden; }
+        canvas { width: 100vw; height: 100vh; object-fit: contain; }
+    </style>
+</head>
+<body>
+    <canvas id="view"></canvas>
+    <script>
+        const canvas = document.getElementById("view");
+        const ctx = canvas.getContext("2d");
+        let images = {};
+        let version = null;
+        let loading = false;
+        let lastState = null;
+
+        function loadImage(url) {
+            return new Promise(resolve => {
+                const img = new Image();
+                img.onload = () => resolve(img);
+                img.onerror = () => resolve(null);
+                img.src = url;
+            });
+        }
+
+        async function loadManifest() {
+            loading = true;
+            try {
+                const manifest = await (await fetch("/model/manifest", {cache: "no-store"})).json();
+                const loaded = {};
+                await Promise.all(manifest.layers.map(async layer => {
+                    loaded[layer.name] = await Promise.all(layer.frames.map(loadImage));
+                }));
+                canvas.width = manifest.width;
+                canvas.height = manifest.height;
+                images = loaded;
+                version = manifest.version;
+            } finally {
+                loading = false;
+            }
+            if (lastState) draw(lastState);
+        }
+
+        function draw(state) {
+            lastState = state;
+            if (state.model_version !== version) {
+                if (!loading) loadManifest();
+                return;
+            }
+            ctx.clearRect(0, 0, canvas.width, canvas.height);
+            for (const [name, frame, x, y, w, h] of state.layers) {
+                const frames = images[name];
+                const img = frames && frames[frame];
+                if (img) ctx.drawImage(img, x, y, w, h);
+            }
+            canvas.style.filter = state.brightness < 1 ? `brightness(${state.brightness})` : "";
+        }
+
+        function connect() {
+            const proto = location.protocol === "https:" ? "wss" : "ws";
+            const ws = new WebSocket(`${proto}://${location.host}/ws?mode=state`);
+            ws.onmessage = event => draw(JSON.parse(event.data));
+            ws.onclose = () => setTimeout(connect, 1000);
+        }
+
+        connect();
+    </script>
+</body>
+</html>"""
+
 class WebServer:
-    def __init__(self, renderer, host="0.0.0.0", port=6969):
+    def __init__(self, renderer, host="0.0.0.0", port=6969, audio=None):
         self.renderer = renderer
+        self.audio = audio  # AudioProcessor для метрик звука
+        self._profile_lock = Lock()
         self.host = host
         self.port = port
         self._thread = None
         self.app = Flask("WebPNGTuberStream")
         self.is_running = False
         self.app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # Отключение кэширования
+        # PNG слоев для клиентского рендеринга: (версия модели, слой, кадр) -> байты;
+        # запросы слоев идут параллельно из потоков Flask
+        self._layer_png_cache = {}
+        self._layer_png_lock = Lock()
         
         # Определение базовой директории
         if getattr(sys, 'frozen', False):
@@ -28,12 +116,107 @@ class WebServer:
         @self.app.route("/stream")
         def stream():
             return Response(
-                self.mjpeg_generator(),
+                self.mjpeg_generator(request.remote_addr or ""),
                 mimetype="multipart/x-mixed-replace; boundary=frame"
             )
 
+        @self.app.route("/snapshot")
+        def snapshot():
+            frame = self.renderer.get_snapshot()
+            if not frame:
+                return Response(status=503)
+            return Response(frame, mimetype=self.renderer.get_frame_mimetype())
+
+        self.sock = Sock(self.app)
+
+        @self.sock.route("/ws")
+        def ws(ws):
+            # mode=frames - бинарные кадры, mode=patches - кадры с частичными
+            # обновлениями, mode=state - только состояние сцены
+            mode = request.args.get("mode", "frames")
+            if mode == "state":
+                self.ws_state_loop(ws)
+            else:
+                self.ws_frames_loop(ws, request.remote_addr or "", patches=(mode == "patches"))
+
+        @self.app.route("/stats/clients")
+        def stats_clients():
+            return jsonify(self.renderer.broadcaster.stats())
+
+        @self.app.route("/stats/frames")
+        def stats_frames():
+            return jsonify(self.renderer.get_frame_stats())
+
+        @self.app.route("/stats/latency")
+        def stats_latency():
+            return jsonify(self.renderer.get_latency_stats())
+
+        @self.app.route("/metrics")
+        def metrics():
+            return Response(prometheus_text(collect_stats(self.renderer, self.audio)),
+                            content_type="text/plain; version=0.0.4; charset=utf-8")
+
+        @self.app.route("/debug/stats")
+        def debug_stats():
+            return jsonify(collect_stats(self.renderer, self.audio))
+
+        @self.app.route("/debug/profile")
+        def debug_profile():
+            # ?seconds=N - длительность, ?format=collapsed - стеки для flamegraph.pl
+            try:
+                seconds = float(request.args.get("seconds", 5))
+            except ValueError:
+                return Response("seconds должен быть числом", status=400)
+            seconds = max(0.1, min(PROFILE_MAX_SECONDS, seconds))
+            thread = self.renderer.render_thread
+            if thread is None:
+                return Response("Рендерер не запущен", status=503)
+            if not self._profile_lock.acquire(blocking=False):
+                return Response("Профиль уже снимается", status=409)
+            try:
+                stacks = sample_thread(thread, seconds)
+            finally:
+                self._profile_lock.release()
+            if request.args.get("format") == "collapsed":
+                return Response(collapsed(stacks), mimetype="text/plain; charset=utf-8")
+            result = summarize(stacks)
+            result['seconds'] = seconds
+            return jsonify(result)
+
+        @self.app.route("/model/manifest")
+        def model_manifest():
+            version, assets = self.renderer.get_layer_assets()
+            layers = []
+            for index, (name, frames) in enumerate(assets):
+                layers.append({
+                    'name': name,
+                    'frames': [f"/model/layer/{version}/{index}/{frame}.png"
+                               for frame in range(len(frames))],
+                })
+            response = jsonify({
+                'version': version,
+                'width': self.renderer.width,
+                'height': self.renderer.height,
+                'layers': layers,
+            })
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+
+        @self.app.route("/model/layer/<int:version>/<int:index>/<int:frame>.png")
+        def model_layer(version, index, frame):
+            data = self.get_layer_png(version, index, frame)
+            if data is None:
+                return Response(status=404)
+            response = Response(data, mimetype="image/png")
+            # Версия модели входит в URL, поэтому содержимое по адресу не меняется
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
+
         @self.app.route("/")
         def index():
+            # ?mode=client - сборка кадра в браузере без кодирования на сервере
+            if request.args.get("mode") == "client":
+                return CLIENT_PAGE
             return """<html>
 <head>
     <title>WebPNGTuber</title>
@@ -53,16 +236,105 @@ class WebServer:
                 mimetype='image/vnd.microsoft.icon'
             )
                 
-    def mjpeg_generator(self):
-        """Генератор MJPEG потока"""
-        while self.is_running:
-            frame = self.renderer.get_frame_bytes()
-            if frame:
-                yield (b"--frame\r\n"
-                       b"Content-Type: image/png\r\n"
-                       b"Content-Length: " + str(len(frame)).encode() + b"\r\n\r\n" + frame + b"\r\n")
-            time.sleep(1.0 / self.renderer.fps)
+    def set_audio(self, audio):
+        """Смена аудиопроцессора для метрик (при смене устройства)"""
+        self.audio = audio
+
+    def mjpeg_generator(self, client_name=""):
+        """Генератор multipart-потока кадров"""
+        # Пока клиент подключен, рендерер кодирует кадры
+        client = self.renderer.add_stream_client(client_name)
+        try:
+            # Граница отправляется сразу после кадра, чтобы браузер показывал
+            # кадр без ожидания следующего
+            yield b"--frame\r\n"
+            part = None
+            while self.is_running:
+                frame = client.wait(timeout=1.0)
+                if frame is None:
+                    # При неподвижной сцене кадров нет, и отключение клиента
+                    # заметно только по ошибке записи: повтор последнего кадра
+                    if part is not None:
+                        yield part
+                    continue
+                seq, data, mimetype = frame
+                part = (b"Content-Type: " + mimetype.encode() + b"\r\n"
+                        b"Content-Length: " + str(len(data)).encode() + b"\r\n\r\n" + data +
+                        b"\r\n--frame\r\n")
+                yield part
+                # Генератор продолжается после записи части в сокет
+                self.renderer.latency.frame_sent(seq)
+        finally:
+            self.renderer.remove_stream_client(client)
                 
+    def get_layer_png(self, version, index, frame):
+        """PNG кадра слоя текущей модели (None, если версия устарела)"""
+        key = (version, index, frame)
+        with self._layer_png_lock:
+            data = self._layer_png_cache.get(key)
+        if data is not None:
+            return data
+        current_version, assets = self.renderer.get_layer_assets()
+        if version != current_version or index >= len(assets):
+            return None
+        frames = assets[index][1]
+        if frame >= len(frames):
+            return None
+        with io.BytesIO() as buf:
+            frames[frame].save(buf, format="PNG")
+            data = buf.getvalue()
+        with self._layer_png_lock:
+            # Слои старых версий модели больше не запрашиваются
+            if any(k[0] != version for k in self._layer_png_cache):
+                self._layer_png_cache = {}
+            self._layer_png_cache[key] = data
+        return data
+
+    def ws_frames_loop(self, ws, client_name="", patches=False):
+        """Отправка бинарных кадров по WebSocket при смене номера кадра.
+
+        С patches=True вместо полного кадра, если клиент получил предыдущий,
+        отправляется заголовок {"type": "patch", "rects": [[x0, y0, x1, y1], ...]}
+        и за ним по одному бинарному сообщению на каждую область.
+        """
+        client = self.renderer.add_stream_client(client_name, patches)
+        mimetype = None
+        try:
+            while self.is_running and ws.connected:
+                frame = client.wait_update(timeout=1.0)
+                if frame is None:
+                    continue
+                seq, data, frame_mimetype, frame_patches = frame
+                # Перед кадрами нового формата отправляется текстовый заголовок
+                if frame_mimetype != mimetype:
+                    mimetype = frame_mimetype
+                    ws.send(json.dumps({'type': 'format', 'mimetype': mimetype}))
+                if patches and frame_patches is not None:
+                    ws.send(json.dumps({'type': 'patch', 'seq': seq,
+                                        'rects': [list(rect) for rect, _ in frame_patches]}))
+                    for _, patch in frame_patches:
+                        ws.send(patch)
+                else:
+                    ws.send(data)
+                self.renderer.latency.frame_sent(seq)
+        finally:
+            self.renderer.remove_stream_client(client)
+
+    def ws_state_loop(self, ws):
+        """Отправка состояния сцены (JSON) по WebSocket без кодирования кадров"""
+        self.renderer.add_state_client()
+        last_seq = None
+        try:
+            while self.is_running and ws.connected:
+                update = self.renderer.wait_scene_state(last_seq, timeout=1.0)
+                if update is None:
+                    continue
+                last_seq, state = update
+                ws.send(json.dumps(state, separators=(',', ':')))
+                self.renderer.latency.state_sent(last_seq)
+        finally:
+            self.renderer.remove_state_client()
+
     def start(self):
         """Запуск веб-сервера"""
         if self.is_running: